@@ -0,0 +1,324 @@
+"""
+Activat VC Bot - офлайн бенчмарк
+Прогоняет синтетический поток апдейтов через обработчики main.py
+на локальных заглушках Bot API и PostgREST с настраиваемой задержкой
+
+Запуск:
+    python benchmark.py --updates 2000 --rate 200 --db-latency 40 --tg-latency 60
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from aiohttp import web
+
+BOT_TOKEN = '123456:BENCHMARK'
+ADMIN_ID = 1000
+CHAT_ID = -1001000000000
+
+# Ответы заглушки PostgREST для RPC, которые возвращают строки
+RPC_RESPONSES = {
+    'growth_stats': [{
+        'total_users': 500,
+        'new_week': 20,
+        'new_month': 80,
+        'active_week': 150,
+        'messages_week': 4000
+    }],
+}
+
+
+class FakePostgrest:
+    """Заглушка Supabase REST: считает запросы по таблицам, отвечает с задержкой"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.app = web.Application()
+        self.app.router.add_route('*', '/rest/v1/{path:.*}', self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = request.match_info['path']
+        self.calls[f"{request.method} {path}"] += 1
+        await request.read()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if path.startswith('rpc/'):
+            rows = RPC_RESPONSES.get(path[len('rpc/'):])
+            if rows is None:
+                # Функции RETURNS VOID: PostgREST отвечает 204 без тела
+                return web.Response(status=204)
+            return web.json_response(rows)
+        if request.method == 'POST':
+            return web.Response(status=201)
+        return web.json_response([])
+
+
+class FakeBotApi:
+    """Заглушка Bot API: sendMessage, sendPoll, getMe и прочие методы"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        self.app = web.Application()
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getMe':
+            result = {
+                'id': 1,
+                'is_bot': True,
+                'first_name': 'Benchmark',
+                'username': 'benchmark_bot',
+                'can_join_groups': True,
+                'can_read_all_group_messages': True,
+                'supports_inline_queries': False
+            }
+        elif method in ('sendMessage', 'sendPoll', 'editMessageText'):
+            chat_id = int(data.get('chat_id', CHAT_ID))
+            result = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'supergroup' if chat_id < 0 else 'private'},
+                'text': data.get('text', '')
+            }
+            if method == 'sendPoll':
+                options = json.loads(data.get('options', '[]'))
+                result['poll'] = {
+                    'id': f"poll{result['message_id']}",
+                    'question': data.get('question', ''),
+                    'options': [{'text': o, 'voter_count': 0} for o in options],
+                    'total_voter_count': 0,
+                    'is_closed': False,
+                    'is_anonymous': False,
+                    'type': 'regular',
+                    'allows_multiple_answers': False
+                }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+
+def make_update(kind: str, update_id: int) -> Dict:
+    """Синтетический апдейт заданного типа"""
+    # /ratepitch доступен всем: от разных участников, чтобы лимит частоты не свел опросы к одному
+    user_id = ADMIN_ID if kind == 'growth' else random.randint(10_000, 10_500)
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': CHAT_ID, 'type': 'supergroup', 'is_forum': True},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'},
+        'message_thread_id': random.choice([5, 6, 7, 8]),
+    }
+    commands = {
+        'search': '/search инвестиции',
+        'growth': '/growth',
+        'network': '/network ищу CTO в финтех',
+        'mentor': '/mentor продукт',
+        'ratepitch': '/ratepitch',
+        'help': '/help',
+    }
+    if kind == 'message':
+        message['text'] = random.choice([
+            'Всем привет! 🚀',
+            'Кто идет на демо-день? 🔥👍',
+            '#pitch Мы делаем B2B SaaS для логистики, ищем pre-seed 💪',
+            'Интересная статья про венчур в ЦА 🤔',
+            'Спасибо за встречу ❤️',
+        ])
+    elif kind == 'join':
+        message['new_chat_members'] = [
+            {'id': random.randint(20_000, 90_000), 'is_bot': False, 'first_name': 'Новичок'}
+            for _ in range(random.randint(1, 3))
+        ]
+    else:
+        text = commands[kind]
+        message['text'] = text
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'message=90,join=3,search=3,growth=1' -> веса типов апдейтов"""
+    mix = {}
+    for part in value.split(','):
+        kind, weight = part.split('=')
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def start_server(app: web.Application) -> (web.AppRunner, str):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(args):
+    postgrest = FakePostgrest(args.db_latency / 1000)
+    bot_api = FakeBotApi(args.tg_latency / 1000)
+    db_runner, db_url = await start_server(postgrest.app)
+    tg_runner, tg_url = await start_server(bot_api.app)
+
+    # Окружение задается до импорта main: конфигурация читается при импорте.
+    # Файлы бота (журнал, хранилище задач и аренды) - во временном каталоге, не в репозитории
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': BOT_TOKEN,
+        'TELEGRAM_CHAT_ID': str(CHAT_ID),
+        'TELEGRAM_ADMIN_IDS': str(ADMIN_ID),
+        'TELEGRAM_API_URL': tg_url,
+        'SUPABASE_URL': db_url,
+        'SUPABASE_KEY': 'benchmark.anon.key',
+        'SCHEDULER_DB_URL': f"sqlite:///{workdir}/jobs.sqlite",
+        'SPOOL_PATH': os.path.join(workdir, 'db_spool.jsonl'),
+        'HTTP_SERVER_ENABLED': 'false',
+        'WELCOME_WINDOW': '0.5',
+        'UPDATE_WORKERS': str(args.workers),
+    })
+    import main
+    logging.getLogger().setLevel(logging.WARNING)
+
+    application = main.build_application()
+    try:
+        await application.initialize()
+        await main.post_init(application)
+        postgrest.calls.clear()
+        bot_api.calls.clear()
+
+        mix = parse_mix(args.mix)
+        kinds = random.choices(list(mix), weights=list(mix.values()), k=args.updates)
+        updates = [(kind, main.Update.de_json(make_update(kind, i + 1), application.bot)) for i, kind in enumerate(kinds)]
+
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        workers = asyncio.Semaphore(args.workers)
+
+        async def process(kind, update):
+            async with workers:
+                started = time.perf_counter()
+                await application.process_update(update)
+                latencies[kind].append(time.perf_counter() - started)
+
+        # Апдейты приходят с заданной частотой, обработка - в ограниченном пуле
+        started = time.perf_counter()
+        tasks = []
+        for i, (kind, update) in enumerate(updates):
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(process(kind, update)))
+        await asyncio.gather(*tasks)
+        handled = time.perf_counter() - started
+
+        # Досылаем отложенные записи и сообщения, чтобы учесть их в счетчиках
+        await asyncio.sleep(float(os.environ['WELCOME_WINDOW']) + 0.1)
+        await main.write_buffer.flush()
+        await main.sender.stop(timeout=args.drain_timeout)
+        await asyncio.gather(*main.followup_tasks, return_exceptions=True)
+    finally:
+        # Фоновые задачи бота останавливаются и при ошибке прогона
+        if main.elector is not None:
+            await main.elector.stop()
+        await main.sender.stop(timeout=0)
+        await main.write_buffer.stop()
+        await main.db.spool.stop()
+        await main.db.close()
+        await application.shutdown()
+        await db_runner.cleanup()
+        await tg_runner.cleanup()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total_db = sum(postgrest.calls.values())
+    total_tg = sum(bot_api.calls.values())
+    report = {
+        'updates': args.updates,
+        'offered_rate': args.rate,
+        'throughput': round(args.updates / handled, 1),
+        'db_calls_per_update': round(total_db / args.updates, 3),
+        'telegram_calls_per_update': round(total_tg / args.updates, 3),
+        'handlers': {
+            kind: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'mean_ms': round(statistics.mean(values) * 1000, 2)
+            }
+            for kind, values in sorted(latencies.items())
+        },
+        'db_calls': dict(postgrest.calls.most_common()),
+        'telegram_calls': dict(bot_api.calls.most_common()),
+    }
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\nUpdates: {report['updates']} @ {report['offered_rate']}/s offered")
+    print(f"Throughput: {report['throughput']} updates/s")
+    print(f"DB calls per update: {report['db_calls_per_update']}")
+    print(f"Telegram calls per update: {report['telegram_calls_per_update']}\n")
+    print(f"{'handler':<12}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for kind, row in report['handlers'].items():
+        print(f"{kind:<12}{row['count']:>8}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['mean_ms']:>10}")
+    print("\nDB calls:")
+    for key, count in report['db_calls'].items():
+        print(f"  {key:<45}{count:>8}")
+    print("Telegram calls:")
+    for key, count in report['telegram_calls'].items():
+        print(f"  {key:<45}{count:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн бенчмарк обработчиков Activat VC Bot')
+    parser.add_argument('--updates', type=int, default=1000, help='сколько апдейтов прогнать')
+    parser.add_argument('--rate', type=float, default=100.0, help='апдейтов в секунду')
+    parser.add_argument('--workers', type=int, default=32, help='параллельная обработка (UPDATE_WORKERS)')
+    parser.add_argument('--db-latency', type=float, default=30.0, help='задержка PostgREST, мс')
+    parser.add_argument('--tg-latency', type=float, default=50.0, help='задержка Bot API, мс')
+    parser.add_argument(
+        '--mix',
+        default='message=90,join=2,search=2,network=1,mentor=2,growth=1,help=2',
+        help='веса типов апдейтов: message, join, search, network, mentor, growth, ratepitch, help'
+    )
+    parser.add_argument('--drain-timeout', type=float, default=5.0, help='сколько ждать досылки сообщений, сек')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='вывести отчет в JSON')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+Activat VC Bot - буферы записи
+Write-behind очередь: вставки копятся в памяти и уходят в Supabase пачками
+Пока база недоступна, пачки уходят в журнал на диске (см. spool.py)
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Пакетная вставка строк: сброс по размеру пачки или по таймеру"""
+
+    def __init__(
+        self,
+        db: Database,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        max_pending: int = 10000,
+        max_retries: int = 5,
+        put_timeout: float = 2.0
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.put_timeout = put_timeout
+
+        self._queues: Dict[str, Deque[dict]] = defaultdict(deque)
+        # Неудачные пачки: (таблица, строки, номер попытки)
+        self._retry: Deque[Tuple[str, List[dict], int]] = deque()
+        self._pending = 0
+        self._space = asyncio.Condition()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flushers: List[Callable[[], Awaitable]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Количество строк, ожидающих записи"""
+        return self._pending
+
+    def register_flusher(self, flusher: Callable[[], Awaitable]):
+        """Дополнительный сброс (кэши, счетчики), выполняется на каждом тике"""
+        self._flushers.append(flusher)
+
+    async def add(self, table: str, row: dict) -> bool:
+        """Постановка строки в очередь; при переполнении ждем свободного места"""
+        async with self._space:
+            if self._pending >= self.max_pending:
+                self._wakeup.set()
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self._pending < self.max_pending),
+                        self.put_timeout
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"Write buffer full, dropping row for {table}")
+                    return False
+
+            queue = self._queues[table]
+            queue.append(row)
+            self._pending += 1
+            if len(queue) >= self.batch_size:
+                self._wakeup.set()
+        return True
+
+    async def start(self):
+        """Запуск фонового цикла сброса"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Write buffer started")
+
+    async def stop(self):
+        """Остановка цикла и финальный сброс всего, что накопилось"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # При остановке повторяем неудачные пачки без пауз
+        for _ in range(self.max_retries):
+            await self.flush()
+            if not self._pending:
+                break
+        if self._pending:
+            logger.error(f"Write buffer stopped with {self._pending} unsaved rows")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write buffer flush error: {e}")
+
+    async def flush(self):
+        """Сброс всех очередей: одна многострочная вставка на пачку"""
+        async with self._flush_lock:
+            await self._flush_tables()
+
+            for flusher in self._flushers:
+                try:
+                    await flusher()
+                except Exception as e:
+                    logger.error(f"Flusher error: {e}")
+
+    async def _flush_tables(self):
+        # После первой неудачи прекращаем тик: остальное подождет следующего
+        for _ in range(len(self._retry)):
+            table, rows, attempt = self._retry.popleft()
+            if not await self._write(table, rows, attempt):
+                return
+
+        # Только то, что накопилось к началу сброса: пришедшее во время вставок ждет
+        # следующего заполнения пачки или тика, иначе пачки мельчают, а флашеры ждут
+        backlog = [(table, len(queue)) for table, queue in self._queues.items()]
+        for table, count in backlog:
+            queue = self._queues[table]
+            while count > 0:
+                rows = [queue.popleft() for _ in range(min(self.batch_size, count))]
+                count -= len(rows)
+                if not await self._write(table, rows, 0):
+                    return
+
+    async def _write(self, table: str, rows: List[dict], attempt: int) -> bool:
+        try:
+            await self.db.insert(table, rows, durable=True)
+            ok = True
+        except Exception as e:
+            if attempt + 1 < self.max_retries:
+                logger.warning(f"Batch insert into {table} failed (attempt {attempt + 1}): {e}")
+                self._retry.append((table, rows, attempt + 1))
+                return False
+            logger.error(f"Dropping {len(rows)} rows for {table} after {self.max_retries} attempts: {e}")
+            ok = False
+
+        async with self._space:
+            self._pending -= len(rows)
+            self._space.notify_all()
+        return ok
+
+
+class UserCache:
+    """LRU/TTL-кэш известных user_id с отложенной записью last_active"""
+
+    def __init__(self, db: Database, max_size: int = 50000, ttl: float = 3600.0):
+        self.db = db
+        self.max_size = max_size
+        self.ttl = ttl
+        self._known: "OrderedDict[int, float]" = OrderedDict()
+        # user_id -> последняя строка для upsert; повторные касания схлопываются
+        self._touched: Dict[int, dict] = {}
+
+    def is_known(self, user_id: int) -> bool:
+        """Пользователь уже есть в БД (по данным кэша)"""
+        seen_at = self._known.get(user_id)
+        if seen_at is None:
+            return False
+        if time.monotonic() - seen_at > self.ttl:
+            del self._known[user_id]
+            return False
+        self._known.move_to_end(user_id)
+        return True
+
+    def remember(self, user_id: int):
+        """Отметить пользователя как существующего в БД"""
+        self._known[user_id] = time.monotonic()
+        self._known.move_to_end(user_id)
+        while len(self._known) > self.max_size:
+            self._known.popitem(last=False)
+
+    async def ensure(self, user_id: int, username: str, first_name: str):
+        """Регистрация нового пользователя одним upsert, для известных - только касание в памяти"""
+        now = datetime.now().isoformat()
+        if not self.is_known(user_id):
+            # ignore_duplicates: не перезаписываем join_date у существующих
+            await self.db.upsert('users', {
+                'user_id': user_id,
+                'username': username,
+                'first_name': first_name,
+                'join_date': now,
+                'last_active': now
+            }, on_conflict='user_id', ignore_duplicates=True, durable=True)
+            self.remember(user_id)
+        self.touch(user_id, username, first_name, now)
+
+    async def ensure_many(self, users: List[dict]):
+        """Регистрация пачки пользователей (user_id, username, first_name) одним upsert"""
+        now = datetime.now().isoformat()
+        new_rows = [
+            {**user, 'join_date': now, 'last_active': now}
+            for user in users
+            if not self.is_known(user['user_id'])
+        ]
+        if new_rows:
+            await self.db.upsert('users', new_rows, on_conflict='user_id', ignore_duplicates=True, durable=True)
+        for user in users:
+            self.remember(user['user_id'])
+            self.touch(user['user_id'], user['username'], user['first_name'], now)
+
+    def touch(self, user_id: int, username: str, first_name: str, when: Optional[str] = None):
+        """Отложенное обновление last_active"""
+        self._touched[user_id] = {
+            'user_id': user_id,
+            'username': username,
+            'first_name': first_name,
+            'last_active': when or datetime.now().isoformat()
+        }
+
+    async def flush(self):
+        """Сброс накопленных касаний одним bulk upsert"""
+        if not self._touched:
+            return
+        rows, self._touched = list(self._touched.values()), {}
+        try:
+            await self.db.upsert('users', rows, on_conflict='user_id', durable=True)
+        except Exception:
+            # Возвращаем строки, не затирая более свежие касания
+            for row in rows:
+                self._touched.setdefault(row['user_id'], row)
+            raise
+
+
+class CounterBuffer:
+    """Счетчики в памяти, сбрасываются пачкой атомарных инкрементов через SQL-функцию"""
+
+    def __init__(self, db: Database, rpc_name: str, key_fields: Sequence[str], value_fields: Sequence[str]):
+        self.db = db
+        self.rpc_name = rpc_name
+        self.key_fields = tuple(key_fields)
+        self.value_fields = tuple(value_fields)
+        self._counts: Dict[tuple, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, key: tuple, *deltas: int):
+        """Прибавить значения (в порядке value_fields) к корзине key"""
+        bucket = self._counts.get(key)
+        if bucket is None:
+            self._counts[key] = list(deltas)
+        else:
+            for i, delta in enumerate(deltas):
+                bucket[i] += delta
+
+    async def flush(self):
+        """Сброс всех корзин одним вызовом SQL-функции"""
+        if not self._counts:
+            return
+        counts, self._counts = self._counts, {}
+        rows = [
+            {**dict(zip(self.key_fields, key)), **dict(zip(self.value_fields, values))}
+            for key, values in counts.items()
+        ]
+        try:
+            await self.db.call(self.rpc_name, {'deltas': rows}, durable=True)
+        except Exception:
+            # Возвращаем дельты, чтобы не потерять их до следующего сброса
+            for key, values in counts.items():
+                self.add(key, *values)
+            raise
+
+
+# Числа, hex-идентификаторы и содержимое кавычек не различают ошибки между собой
+_FINGERPRINT_NOISE = re.compile(r"0x[0-9a-f]+|[0-9a-f]{8}-[0-9a-f-]{27}|\d+|'[^']*'|\"[^\"]*\"", re.IGNORECASE)
+
+
+class ErrorAggregator:
+    """Схлопывание повторяющихся ошибок: одна строка bot_logs на отпечаток за интервал"""
+
+    def __init__(self, db: Database, table: str = 'bot_logs', interval: float = 60.0, max_rows: int = 50):
+        self.db = db
+        self.table = table
+        self.interval = interval
+        self.max_rows = max_rows
+        # отпечаток -> строка с количеством, первым/последним появлением и примером
+        self._errors: Dict[str, dict] = {}
+        self._last_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._errors)
+
+    @staticmethod
+    def fingerprint(level: str, message: str) -> str:
+        """Уровень + текст без переменных частей (id, числа, строки в кавычках)"""
+        return f"{level}:{_FINGERPRINT_NOISE.sub('#', message)[:200]}"
+
+    def add(self, level: str, message: str):
+        """Учет ошибки в памяти, без обращения к БД"""
+        now = datetime.now().isoformat()
+        key = self.fingerprint(level, message)
+        entry = self._errors.get(key)
+        if entry is None:
+            self._errors[key] = {
+                'level': level,
+                'message': message,
+                'fingerprint': key,
+                'count': 1,
+                'first_seen': now,
+                'last_seen': now,
+                'timestamp': now
+            }
+        else:
+            entry['count'] += 1
+            entry['last_seen'] = now
+            entry['timestamp'] = now
+
+    async def flush(self, force: bool = False):
+        """Раз в interval - одна вставка, не больше max_rows строк"""
+        if not self._errors or (not force and time.monotonic() - self._last_flush < self.interval):
+            return
+        self._last_flush = time.monotonic()
+        errors, self._errors = self._errors, {}
+
+        rows = sorted(errors.values(), key=lambda row: row['count'], reverse=True)
+        if len(rows) > self.max_rows:
+            # Самые частые - как есть, хвост - одной сводной строкой
+            kept, rest = rows[:self.max_rows - 1], rows[self.max_rows - 1:]
+            now = datetime.now().isoformat()
+            kept.append({
+                'level': 'warning',
+                'message': f"{len(rest)} more error kinds suppressed ({sum(r['count'] for r in rest)} events)",
+                'fingerprint': 'suppressed',
+                'count': sum(r['count'] for r in rest),
+                'first_seen': min(r['first_seen'] for r in rest),
+                'last_seen': now,
+                'timestamp': now
+            })
+            rows = kept
+
+        try:
+            await self.db.insert(self.table, rows, durable=True)
+        except Exception as e:
+            # Не возвращаем строки в очередь: ошибка записи ошибок не должна копиться
+            logger.error(f"Dropping {len(rows)} aggregated error rows: {e}")
@@ -0,0 +1,44 @@
+"""
+Activat VC Bot - когортный анализ
+Матрица удержания «неделя вступления × неделя активности» считается векторно в NumPy
+по компактным массивам: неделя вступления и битовая маска активных недель на пользователя
+"""
+
+from datetime import date, timedelta
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def retention_matrix(join_weeks: Sequence[int], active_masks: Sequence[int], weeks: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Размеры когорт и доли активных: rates[c, k] - доля когорты c, писавшей на k-й неделе после вступления"""
+    joins = np.asarray(join_weeks, dtype=np.int64)
+    masks = np.asarray(active_masks, dtype=np.int64)
+    sizes = np.bincount(joins, minlength=weeks)[:weeks]
+
+    # Абсолютная неделя для каждой пары (пользователь, неделя после вступления)
+    absolute = joins[:, None] + np.arange(weeks)[None, :]
+    observed = absolute < weeks
+    active = ((masks[:, None] >> np.minimum(absolute, weeks - 1)) & 1).astype(bool) & observed
+
+    retained = np.zeros((weeks, weeks), dtype=np.int64)
+    np.add.at(retained, joins, active)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(sizes[:, None] > 0, retained / sizes[:, None], np.nan)
+    # Недели, которые для когорты еще не наступили
+    rates[np.arange(weeks)[:, None] + np.arange(weeks)[None, :] >= weeks] = np.nan
+    return sizes, rates
+
+
+def render_table(base_week: date, sizes: np.ndarray, rates: np.ndarray) -> str:
+    """Моноширинная таблица: строка - когорта, столбец - неделя после вступления, %"""
+    weeks = len(sizes)
+    lines = ['Когорта  Юзеров ' + ''.join(f"{f'W{k}':>5}" for k in range(weeks))]
+    for cohort in range(weeks):
+        start = base_week + timedelta(weeks=cohort)
+        cells = ''.join(
+            '    ·' if np.isnan(rate) else f"{rate * 100:>4.0f}%"
+            for rate in rates[cohort]
+        )
+        lines.append(f"{start.strftime('%d.%m'):<8} {sizes[cohort]:>6} {cells}")
+    return '\n'.join(lines)
@@ -0,0 +1,272 @@
+"""
+Activat VC Bot - слой доступа к данным
+Асинхронный клиент Supabase: общий пул HTTP-соединений и таймаут на каждый запрос
+Circuit breaker: при недоступной базе запросы не ждут таймаутов, а записи уходят в журнал на диске
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import httpx
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from supabase import AsyncClient, AsyncClientOptions
+
+from metrics import DB_CIRCUIT_OPEN, DB_LATENCY, DB_REQUESTS
+from spool import Spool
+
+logger = logging.getLogger(__name__)
+
+Rows = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+# Коды PostgREST «нет соединения с Postgres / схема не загружена / пул занят» (HTTP 503/504)
+OUTAGE_CODES = frozenset({'PGRST000', 'PGRST001', 'PGRST002', 'PGRST003'})
+
+
+class CircuitOpenError(ConnectionError):
+    """База признана недоступной, запрос не отправлялся"""
+
+
+class CircuitBreaker:
+    """closed -> open после failure_threshold сбоев подряд; через reset_timeout - одна пробная попытка"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def ready(self) -> bool:
+        """Пропустит ли allow() следующий запрос (без занятия пробной попытки)"""
+        if self.opened_at is None:
+            return True
+        return not self._probing and time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        """Можно ли отправлять запрос сейчас"""
+        if not self.ready():
+            return False
+        if self.opened_at is None:
+            return True
+        # half-open: пропускаем один запрос, остальные ждут его результата
+        self._probing = True
+        return True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("✅ DB circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        DB_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            if self.opened_at is None:
+                logger.error(f"❌ DB circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            DB_CIRCUIT_OPEN.set(1)
+        self._probing = False
+
+    def abandon(self):
+        """Пробный запрос отменен без результата - следующий сможет попробовать снова"""
+        self._probing = False
+
+
+class Database:
+    """Единая точка доступа к Supabase для всех корутин бота"""
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        timeout: float = 10.0,
+        max_concurrency: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        spool: Optional[Spool] = None
+    ):
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        # Журнал для durable-записей, которые не удалось отправить
+        self.spool = spool
+        # Один AsyncClient = одна httpx-сессия с пулом keep-alive соединений на весь процесс
+        self.client = AsyncClient(
+            url,
+            key,
+            AsyncClientOptions(postgrest_client_timeout=timeout)
+        )
+        # Ограничиваем число одновременных запросов, чтобы не раздувать пул
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def table(self, name: str):
+        """Построитель запроса к таблице (выполняется через execute)"""
+        return self.client.table(name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None):
+        """Построитель вызова SQL-функции (выполняется через execute)"""
+        return self.client.rpc(fn, params or {})
+
+    @staticmethod
+    def is_outage(error: Exception) -> bool:
+        """Сбой связи или 5xx, а не отказ базы принять конкретный запрос.
+        PostgREST без Postgres отвечает 503 с кодом PGRST000-PGRST003 (строкой) - это тоже недоступность
+
+        >>> Database.is_outage(APIError({'code': 'PGRST001', 'message': 'Database client error'}))
+        True
+        >>> Database.is_outage(APIError({'code': 503}))
+        True
+        >>> Database.is_outage(APIError({'code': '23505', 'message': 'duplicate key'}))
+        False
+        >>> Database.is_outage(APIError({'code': 'PGRST116', 'message': 'no rows'}))
+        False
+        """
+        if isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError)):
+            return True
+        if not isinstance(error, APIError):
+            return False
+        if isinstance(error.code, int):
+            return error.code >= 500
+        return error.code in OUTAGE_CODES
+
+    async def execute(self, query, timeout: Optional[float] = None):
+        """Выполнение запроса с таймаутом: медленный PostgREST не блокирует бота"""
+        async def _run():
+            async with self._slots:
+                return await query.execute()
+
+        # /users -> users, /rpc/growth_stats -> rpc/growth_stats
+        table = query.path.lstrip('/')
+        if not self.breaker.allow():
+            DB_REQUESTS.labels(table, query.http_method, 'circuit_open').inc()
+            raise CircuitOpenError(f"DB circuit open: {query.http_method} {query.path}")
+
+        started = time.perf_counter()
+        status = 'error'
+        settled = False
+        try:
+            result = await asyncio.wait_for(_run(), timeout or self.timeout)
+            status = 'ok'
+            settled = True
+            self.breaker.record_success()
+            return result
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            settled = True
+            self.breaker.record_failure()
+            raise TimeoutError(f"DB request timed out: {query.http_method} {query.path}")
+        except Exception as e:
+            settled = True
+            self._record(e)
+            raise
+        finally:
+            if not settled:
+                # Отмена (CancelledError) без результата: пробная попытка освобождается
+                self.breaker.abandon()
+            DB_REQUESTS.labels(table, query.http_method, status).inc()
+            DB_LATENCY.labels(table, query.http_method).observe(time.perf_counter() - started)
+
+    def _record(self, error: Exception):
+        if self.is_outage(error):
+            self.breaker.record_failure()
+        else:
+            # База ответила - связь в порядке, ошибка в самом запросе
+            self.breaker.record_success()
+
+    async def _durable(self, op: str, table: str, rows: Any, query, **options):
+        """Запись, которая при недоступной базе уходит в журнал вместо ошибки"""
+        try:
+            return await self.execute(query)
+        except Exception as e:
+            if self.spool is None or not self.is_outage(e):
+                raise
+            self.spool.append(op, table, rows, **options)
+            return None
+
+    async def insert(self, table: str, rows: Rows, durable: bool = False):
+        """Вставка одной строки или пачки строк одним запросом"""
+        query = self.table(table).insert(rows, returning=ReturnMethod.minimal)
+        if durable:
+            return await self._durable('insert', table, rows, query)
+        return await self.execute(query)
+
+    async def upsert(
+        self,
+        table: str,
+        rows: Rows,
+        on_conflict: str = '',
+        ignore_duplicates: bool = False,
+        durable: bool = False
+    ):
+        """Upsert одной строки или пачки строк одним запросом"""
+        query = self.table(table).upsert(
+            rows,
+            on_conflict=on_conflict,
+            ignore_duplicates=ignore_duplicates,
+            returning=ReturnMethod.minimal
+        )
+        if durable:
+            return await self._durable(
+                'upsert', table, rows, query, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates
+            )
+        return await self.execute(query)
+
+    async def call(self, fn: str, params: Optional[dict] = None, durable: bool = False):
+        """Вызов SQL-функции; durable - для инкрементов, которые нельзя потерять"""
+        query = self.rpc(fn, params)
+        if durable:
+            return await self._durable('rpc', fn, params or {}, query)
+        return await self.execute(query)
+
+    async def replay_spool(self) -> int:
+        """Досылка журнала, если база доступна (или пора сделать пробный запрос)"""
+        if self.spool is None or not self.spool.pending or not self.breaker.ready():
+            return 0
+        return await self.spool.replay(self)
+
+    async def upload(self, bucket: str, path: str, file_path: str, content_type: str = 'application/gzip'):
+        """Загрузка файла в Supabase Storage (без таймаута запроса: архивы бывают большими);
+        возвращает управление, только когда объект виден в бакете с тем же размером"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"DB circuit open: upload {bucket}/{path}")
+        settled = False
+        try:
+            storage = self.client.storage.from_(bucket)
+            result = await storage.upload(
+                path,
+                Path(file_path),
+                {'content-type': content_type, 'upsert': 'true'}
+            )
+            folder, _, name = path.rpartition('/')
+            stored_size = None
+            for item in await storage.list(folder, {'search': name}):
+                if item.get('name') == name:
+                    stored_size = (item.get('metadata') or {}).get('size')
+            if stored_size != os.path.getsize(file_path):
+                raise IOError(f"Upload not confirmed: {bucket}/{path} stored size {stored_size}")
+            settled = True
+            self.breaker.record_success()
+            return result
+        except Exception as e:
+            settled = True
+            self._record(e)
+            raise
+        finally:
+            if not settled:
+                self.breaker.abandon()
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        try:
+            await self.client.postgrest.aclose()
+        except Exception as e:
+            logger.error(f"DB close error: {e}")
@@ -0,0 +1,101 @@
+"""
+Activat VC Bot - выгрузка истории
+Постраничное чтение по ключу (timestamp, id) и потоковая запись в gzip (JSONL или CSV):
+в памяти не больше одной страницы независимо от объема таблицы
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+# Какие таблицы и колонки можно выгружать
+EXPORT_TABLES: Dict[str, Tuple[str, ...]] = {
+    'group_logs': ('id', 'timestamp', 'user_id', 'username', 'thread_id', 'text'),
+    'pitches': ('id', 'timestamp', 'user_id', 'username', 'likes', 'chat_id', 'message_id', 'text'),
+    'networks': ('id', 'timestamp', 'user_id', 'username', 'text'),
+}
+FORMATS = ('jsonl', 'csv')
+
+
+def _quote(value: str) -> str:
+    """Значение для фильтра PostgREST внутри or=(...): время содержит ':' и '+'"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+async def iter_pages(
+    db: Database,
+    table: str,
+    columns: Tuple[str, ...],
+    start: datetime,
+    end: datetime,
+    page_size: int = 1000
+) -> AsyncIterator[List[dict]]:
+    """Страницы строк за [start, end) по возрастанию (timestamp, id) без OFFSET"""
+    last: Optional[dict] = None
+    while True:
+        query = (
+            db.table(table)
+            .select(*columns)
+            .gte('timestamp', start.isoformat())
+            .lt('timestamp', end.isoformat())
+        )
+        if last is not None:
+            # Продолжаем строго после последней строки предыдущей страницы
+            ts = _quote(last['timestamp'])
+            query = query.or_(f"timestamp.gt.{ts},and(timestamp.eq.{ts},id.gt.{last['id']})")
+        result = await db.execute(query.order('timestamp').order('id').limit(page_size))
+        if not result.data:
+            return
+        yield result.data
+        # Короткая страница - не признак конца: PostgREST режет ответ до max-rows (1000 на Supabase),
+        # даже если page_size больше. Заканчиваем только на пустой странице
+        last = result.data[-1]
+
+
+def _encode(rows: List[dict], columns: Tuple[str, ...], fmt: str, header: bool) -> str:
+    if fmt == 'jsonl':
+        return ''.join(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in rows)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def export_table(
+    db: Database,
+    table: str,
+    start: datetime,
+    end: datetime,
+    path: str,
+    fmt: str = 'jsonl',
+    page_size: int = 1000
+) -> int:
+    """Выгрузка таблицы за период в gzip-файл path; возвращает число строк"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Table {table} is not exportable")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt}")
+
+    columns = EXPORT_TABLES[table]
+    total = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            # Заголовок пишется и для пустой выгрузки
+            f.write(_encode([], columns, fmt, header=True))
+        async for rows in iter_pages(db, table, columns, start, end, page_size):
+            # Сжатие - в потоке, чтобы не задерживать обработку апдейтов
+            await asyncio.to_thread(f.write, _encode(rows, columns, fmt, header=False))
+            total += len(rows)
+    logger.info(f"✅ Exported {total} rows from {table} to {path}")
+    return total
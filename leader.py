@@ -0,0 +1,148 @@
+"""
+Activat VC Bot - выбор лидера
+Аренда (lease) в таблице scheduler_leases: строку держит одна реплика и продлевает ее
+heartbeat'ом; остальные ждут, пока аренда истечет. Только лидер запускает cron-задачи
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import Column, Float, MetaData, String, Table, create_engine, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from metrics import IS_LEADER
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+leases = Table(
+    'scheduler_leases',
+    metadata,
+    Column('name', String(64), primary_key=True),
+    Column('holder', String(128), nullable=False),
+    Column('expires_at', Float, nullable=False)
+)
+
+
+def default_holder() -> str:
+    """Идентификатор реплики: инстанс Render или hostname:pid"""
+    return os.getenv('RENDER_INSTANCE_ID') or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderLease:
+    """Строка аренды в SQL-базе (Postgres в production, SQLite локально)"""
+
+    def __init__(self, url: str, name: str = 'scheduler', ttl: float = 30.0, holder: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or default_holder()
+        self.engine = create_engine(url, pool_pre_ping=True)
+        metadata.create_all(self.engine, tables=[leases])
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        """Захват или продление аренды; True - эта реплика лидер до now + ttl"""
+        now = time.time() if now is None else now
+        with self.engine.begin() as conn:
+            # Одним UPDATE: продлеваем свою аренду или забираем истекшую чужую
+            result = conn.execute(
+                update(leases)
+                .where(leases.c.name == self.name)
+                .where((leases.c.holder == self.holder) | (leases.c.expires_at < now))
+                .values(holder=self.holder, expires_at=now + self.ttl)
+            )
+            if result.rowcount:
+                return True
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(leases).values(name=self.name, holder=self.holder, expires_at=now + self.ttl))
+            return True
+        except IntegrityError:
+            # Строка есть и аренда чужая, действующая
+            return False
+
+    def release(self):
+        """Досрочное освобождение при остановке, чтобы другая реплика не ждала ttl"""
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(leases)
+                .where(leases.c.name == self.name)
+                .where(leases.c.holder == self.holder)
+                .values(expires_at=0.0)
+            )
+
+    def close(self):
+        self.engine.dispose()
+
+
+class LeaderElector:
+    """Heartbeat аренды: вызывает on_elected / on_demoted при смене лидерства"""
+
+    def __init__(
+        self,
+        lease: LeaderLease,
+        on_elected: Callable[[], Awaitable],
+        on_demoted: Callable[[], Awaitable],
+        interval: Optional[float] = None
+    ):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        # Продлеваем заметно раньше истечения, чтобы пережить медленный запрос
+        self.interval = interval or lease.ttl / 3
+        self.is_leader = False
+        self._renewed_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Первая попытка сразу, дальше - каждые interval секунд"""
+        if self._task is None:
+            await self._heartbeat()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка heartbeat и освобождение аренды"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._set_leader(False)
+            try:
+                await asyncio.to_thread(self.lease.release)
+            except Exception as e:
+                logger.error(f"Lease release error: {e}")
+        await asyncio.to_thread(self.lease.close)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._heartbeat()
+
+    async def _heartbeat(self):
+        try:
+            acquired = await asyncio.to_thread(self.lease.try_acquire)
+            if acquired:
+                self._renewed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Lease heartbeat error: {e}")
+            # Без связи с базой уступаем чуть раньше истечения аренды, пока ее не забрал другой
+            acquired = self.is_leader and time.monotonic() - self._renewed_at < self.lease.ttl - self.interval
+        if acquired != self.is_leader:
+            await self._set_leader(acquired)
+
+    async def _set_leader(self, leader: bool):
+        self.is_leader = leader
+        IS_LEADER.set(int(leader))
+        if leader:
+            logger.info(f"👑 {self.lease.holder} is now the scheduler leader")
+            await self.on_elected()
+        else:
+            logger.warning(f"{self.lease.holder} lost scheduler leadership")
+            await self.on_demoted()
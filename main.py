@@ -5,22 +5,50 @@ Python 3.10 | python-telegram-bot 21.x
 """
 
 import os
+import re
+import signal
+import html
+import time
+import functools
 import asyncio
 import logging
+import math
+import tempfile
+from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, Dict
-from telegram import Update, Poll
+from typing import Optional, Dict, List, Set
+from telegram import Bot, Update, Poll, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
+    ApplicationHandlerStop,
     CommandHandler,
+    CallbackQueryHandler,
+    MessageReactionHandler,
     MessageHandler,
     filters,
     ContextTypes
 )
 from telegram.constants import ParseMode
-from supabase import create_client, Client
+from telegram.error import BadRequest, Forbidden
+from db import CircuitBreaker, Database
+from spool import Spool
+from buffers import CounterBuffer, ErrorAggregator, UserCache, WriteBehindBuffer
+from web import WebhookServer
+from sender import BROADCAST, DIRECT, REPLY, SendQueue
+from pitches import PitchBoard
+from export import EXPORT_TABLES, FORMATS, export_table
+from cohorts import render_table, retention_matrix
+from leader import LeaderElector, LeaderLease
+from tags import TagRouter
+from mentors import MentorDirectory
+from ratelimit import CommandRateLimiter, parse_limits
+import metrics
+from apscheduler.events import EVENT_JOB_MISSED
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 # ============= LOGGING =============
 logging.basicConfig(
@@ -33,6 +61,27 @@ logger = logging.getLogger(__name__)
 # Render автоматически предоставляет PORT для веб-сервисов
 PORT = int(os.getenv('PORT', '8443'))
 
+# Режим получения апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Render сам выставляет RENDER_EXTERNAL_URL для веб-сервисов
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') or os.getenv('RENDER_EXTERNAL_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_MAX_QUEUE = int(os.getenv('WEBHOOK_MAX_QUEUE', '1000'))
+# Сколько апдейтов обрабатывается параллельно
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '32'))
+# HTTP-сервер с /metrics и /health (в webhook режиме включен всегда)
+HTTP_SERVER_ENABLED = os.getenv('HTTP_SERVER_ENABLED', 'true').lower() == 'true'
+
+# Лимиты исходящих сообщений (Telegram: ~30/сек всего, 20/мин в группу, 1/сек в личку)
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '25'))
+SEND_GROUP_PER_MINUTE = float(os.getenv('SEND_GROUP_PER_MINUTE', '20'))
+SEND_PRIVATE_RATE = float(os.getenv('SEND_PRIVATE_RATE', '1'))
+
+# Приветствие новичков: окно накопления (сек) и максимум упоминаний в одном сообщении
+WELCOME_WINDOW = float(os.getenv('WELCOME_WINDOW', '10'))
+WELCOME_MAX_MENTIONS = int(os.getenv('WELCOME_MAX_MENTIONS', '50'))
+
 # Проверка версии Python
 import sys
 if sys.version_info >= (3, 12):
@@ -43,6 +92,8 @@ if sys.version_info >= (3, 12):
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = int(os.getenv('TELEGRAM_CHAT_ID', '-1003812789640'))
 TELEGRAM_ADMIN_IDS = [int(x.strip()) for x in os.getenv('TELEGRAM_ADMIN_IDS', '').split(',') if x.strip()]
+# Свой Bot API сервер (self-hosted telegram-bot-api или заглушка benchmark.py)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
 
 # Thread IDs
 DISCUSSION_THREAD_ID = int(os.getenv('TELEGRAM_DISCUSSION_THREAD_ID', '5'))
@@ -53,6 +104,71 @@ NETWORK_THREAD_ID = int(os.getenv('TELEGRAM_NETWORK_THREAD_ID', '7'))
 # Supabase
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+DB_TIMEOUT = float(os.getenv('DB_TIMEOUT', '10'))
+DB_MAX_CONCURRENCY = int(os.getenv('DB_MAX_CONCURRENCY', '20'))
+# Circuit breaker: сколько сбоев подряд открывают его и через сколько секунд пробовать снова
+DB_BREAKER_THRESHOLD = int(os.getenv('DB_BREAKER_THRESHOLD', '5'))
+DB_BREAKER_RESET = float(os.getenv('DB_BREAKER_RESET', '30'))
+# Журнал записей на время недоступности Supabase
+SPOOL_PATH = os.getenv('SPOOL_PATH', 'db_spool.jsonl')
+SPOOL_FSYNC_INTERVAL = float(os.getenv('SPOOL_FSYNC_INTERVAL', '1'))
+
+# Write-behind буфер для group_logs, pitches, bot_logs
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '100'))
+WRITE_FLUSH_INTERVAL = float(os.getenv('WRITE_FLUSH_INTERVAL', '5'))
+WRITE_MAX_PENDING = int(os.getenv('WRITE_MAX_PENDING', '10000'))
+
+# Кэш известных пользователей
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '50000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '3600'))
+
+# Агрегация bot_logs: интервал сброса (сек) и максимум строк за интервал
+ERROR_LOG_INTERVAL = float(os.getenv('ERROR_LOG_INTERVAL', '60'))
+ERROR_LOG_MAX_ROWS = int(os.getenv('ERROR_LOG_MAX_ROWS', '50'))
+
+# Кэш результата /growth (сек)
+GROWTH_CACHE_TTL = float(os.getenv('GROWTH_CACHE_TTL', '60'))
+# /cohorts: сколько недель в матрице удержания (маска активности - BIGINT)
+COHORT_WEEKS = min(int(os.getenv('COHORT_WEEKS', '12')), 26)
+
+# Полнотекстовый поиск: результатов на страницу
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '5'))
+# Сколько последних поисков на чат можно листать кнопкой «Ещё»
+SEARCH_STATES_PER_CHAT = 100
+# Лимиты частоты команд на пользователя: команда=вызовов/секунд через запятую
+RATE_LIMITS = parse_limits(os.getenv('RATE_LIMITS', 'search=5/60,network=2/300,growth=3/60,cohorts=3/60,export=2/300,ratepitch=1/600,toppitches=3/60'))
+
+# Длительность голосования /ratepitch (часы)
+PITCH_POLL_HOURS = int(os.getenv('PITCH_POLL_HOURS', '24'))
+# Лидерборд питчей: размер топа и окно (дни)
+PITCH_TOP_SIZE = int(os.getenv('PITCH_TOP_SIZE', '10'))
+PITCH_WINDOW_DAYS = int(os.getenv('PITCH_WINDOW_DAYS', '30'))
+# Хэштеги, сообщения с которыми сохраняются в tagged_posts (#pitch - всегда в pitches)
+TAGGED_POST_TAGS = [t.strip().lstrip('#').lower() for t in os.getenv('TAGGED_POST_TAGS', 'hiring,event,ask').split(',') if t.strip()]
+# Как часто /toppitches перечитывает лайки из БД (их копят все реплики)
+PITCH_BOARD_REFRESH = float(os.getenv('PITCH_BOARD_REFRESH', '300'))
+# Как часто /mentor дочитывает изменения каталога менторов (сек)
+MENTOR_REFRESH_INTERVAL = float(os.getenv('MENTOR_REFRESH_INTERVAL', '60'))
+# Не чаще раза в столько секунд перечитывать активный челлендж (его могла создать другая реплика)
+CHALLENGE_REFRESH_INTERVAL = float(os.getenv('CHALLENGE_REFRESH_INTERVAL', '60'))
+
+# /export: строк на страницу при чтении из Supabase
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+# Партиции group_logs: сколько месяцев держать в базе, куда выгружать старые
+GROUP_LOGS_RETENTION_MONTHS = int(os.getenv('GROUP_LOGS_RETENTION_MONTHS', '12'))
+# Бакет Supabase Storage для архивов; без него старые партиции не удаляются
+ARCHIVE_BUCKET = os.getenv('ARCHIVE_BUCKET')
+# Лимит Bot API на отправку документа
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+# Постоянное хранилище задач планировщика (SQLite локально, Postgres на Render)
+SCHEDULER_DB_URL = os.getenv('SCHEDULER_DB_URL', 'sqlite:///scheduler_jobs.sqlite')
+# Сколько секунд после пропущенного запуска его еще можно догнать
+SCHEDULER_WEEKLY_GRACE = int(os.getenv('SCHEDULER_WEEKLY_GRACE', str(12 * 3600)))
+SCHEDULER_MONTHLY_GRACE = int(os.getenv('SCHEDULER_MONTHLY_GRACE', str(48 * 3600)))
+# Выбор лидера среди реплик: cron-задачи выполняет только держатель аренды
+LEADER_DB_URL = os.getenv('LEADER_DB_URL', SCHEDULER_DB_URL)
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', '30'))
 
 # Проверка обязательных переменных
 if not all([TELEGRAM_BOT_TOKEN, SUPABASE_URL, SUPABASE_KEY]):
@@ -63,44 +179,134 @@ if not TELEGRAM_ADMIN_IDS:
     logger.error("❌ TELEGRAM_ADMIN_IDS не может быть пустым!")
     raise ValueError("TELEGRAM_ADMIN_IDS is required")
 
-# Инициализация Supabase
+if BOT_MODE == 'webhook' and not all([WEBHOOK_URL, WEBHOOK_SECRET]):
+    logger.error("❌ Для webhook режима нужны WEBHOOK_URL и WEBHOOK_SECRET!")
+    raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode")
+
+# Только типы апдейтов, для которых зарегистрированы обработчики
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.MESSAGE_REACTION]
+
+# Инициализация Supabase (асинхронный клиент, запросы не блокируют event loop)
 try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    db = Database(
+        SUPABASE_URL,
+        SUPABASE_KEY,
+        timeout=DB_TIMEOUT,
+        max_concurrency=DB_MAX_CONCURRENCY,
+        breaker=CircuitBreaker(failure_threshold=DB_BREAKER_THRESHOLD, reset_timeout=DB_BREAKER_RESET),
+        spool=Spool(SPOOL_PATH, fsync_interval=SPOOL_FSYNC_INTERVAL)
+    )
     logger.info("✅ Supabase подключен")
 except Exception as e:
     logger.error(f"❌ Ошибка подключения Supabase: {e}")
     raise
 
+# Эмодзи для анализа настроений
+SENTIMENT_EMOJIS = {
+    'positive': ['😊', '😄', '🎉', '❤️', '👍', '🔥', '✨', '💪', '🚀', '⭐'],
+    'negative': ['😢', '😞', '😠', '👎', '💔', '😰'],
+    'neutral': ['🤔', '🙂', '😐'],
+}
+SENTIMENT_CLASSES = ('positive', 'negative', 'neutral')
+EMOJI_CLASS = {emoji: SENTIMENT_CLASSES.index(cls) for cls, emojis in SENTIMENT_EMOJIS.items() for emoji in emojis}
+# Один проход по тексту: длинные последовательности (❤️ = ❤ + VS16) проверяются первыми
+EMOJI_PATTERN = re.compile('|'.join(re.escape(e) for e in sorted(EMOJI_CLASS, key=len, reverse=True)))
+
 # Глобальные переменные
-scheduler = AsyncIOScheduler()
-active_pitches: Dict[int, Dict] = {}
+# cron-задачи - в постоянном хранилище, закрытия опросов - в памяти (восстанавливаются из pitch_polls)
+scheduler = AsyncIOScheduler(
+    jobstores={
+        'default': MemoryJobStore(),
+        'persistent': SQLAlchemyJobStore(url=SCHEDULER_DB_URL)
+    },
+    job_defaults={'coalesce': True, 'max_instances': 1}
+)
+telegram_bot: Optional[Bot] = None
+elector: Optional[LeaderElector] = None
+http_server: Optional[WebhookServer] = None
+sender = SendQueue(
+    global_rate=SEND_GLOBAL_RATE,
+    group_rate=SEND_GROUP_PER_MINUTE / 60,
+    private_rate=SEND_PRIVATE_RATE
+)
+pending_joins: Dict[int, Dict] = {}
+welcome_task: Optional[asyncio.Task] = None
+# Продолжения обработчиков, ждущие отправки в группу
+followup_tasks: Set[asyncio.Task] = set()
+write_buffer = WriteBehindBuffer(
+    db,
+    batch_size=WRITE_BATCH_SIZE,
+    flush_interval=WRITE_FLUSH_INTERVAL,
+    max_pending=WRITE_MAX_PENDING
+)
+user_cache = UserCache(db, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+write_buffer.register_flusher(user_cache.flush)
+sentiment_counters = CounterBuffer(
+    db,
+    'increment_sentiment_buckets',
+    key_fields=('day', 'thread_id'),
+    value_fields=('positive_count', 'negative_count', 'neutral_count')
+)
+write_buffer.register_flusher(sentiment_counters.flush)
+pitch_board = PitchBoard(top_size=PITCH_TOP_SIZE, window_days=PITCH_WINDOW_DAYS)
+pitch_board_loaded_at = 0.0
+tag_router = TagRouter()
+rate_limiter = CommandRateLimiter(RATE_LIMITS)
+mentor_directory = MentorDirectory()
+mentors_checked_at = 0.0
+# Активный челлендж: id строки и пост в группе, ответы на который считаются ответами
+active_challenge: Optional[Dict] = None
+active_challenge_checked_at = 0.0
+# Лайки-реакции: пишутся по сообщению независимо от локальной доски (питч мог прийти на другую реплику);
+# user_id нужен БД, чтобы не засчитать реакции автора
+pitch_likes = CounterBuffer(
+    db,
+    'increment_pitch_likes',
+    key_fields=('chat_id', 'message_id', 'user_id'),
+    value_fields=('likes',)
+)
+write_buffer.register_flusher(pitch_likes.flush)
+# Лайки-ответы: ключ с user_id, в БД засчитывается первый ответ пользователя на питч
+pitch_reply_likes = CounterBuffer(
+    db,
+    'add_pitch_reply_likes',
+    key_fields=('chat_id', 'message_id', 'user_id'),
+    value_fields=('likes',)
+)
+write_buffer.register_flusher(pitch_reply_likes.flush)
+activity_counters = CounterBuffer(
+    db,
+    'increment_activity_daily',
+    key_fields=('day', 'thread_id', 'user_id'),
+    value_fields=('messages',)
+)
+write_buffer.register_flusher(activity_counters.flush)
+error_log = ErrorAggregator(db, interval=ERROR_LOG_INTERVAL, max_rows=ERROR_LOG_MAX_ROWS)
+write_buffer.register_flusher(error_log.flush)
+# Журнал досылается на тиках буфера, как только база снова отвечает
+write_buffer.register_flusher(db.replay_spool)
+growth_cache: Dict = {'stats': None, 'computed_at': None, 'expires': 0.0}
 
 # ============= DATABASE FUNCTIONS =============
 
 async def log_to_supabase(table: str, data: dict) -> bool:
-    """Универсальная функция логирования в Supabase"""
+    """Универсальная функция логирования в Supabase (при недоступной базе - в журнал)"""
     try:
-        supabase.table(table).insert(data).execute()
+        await db.insert(table, data, durable=True)
         return True
     except Exception as e:
+        # Сюда попадают только отказы самой базы: сбои связи уже ушли в журнал
         logger.error(f"DB error in {table}: {e}")
         await log_bot_error('error', f"DB error in {table}: {str(e)}")
         return False
 
 async def log_bot_error(level: str, message: str):
-    """Логирование ошибок бота"""
-    try:
-        supabase.table('bot_logs').insert({
-            'level': level,
-            'message': message,
-            'timestamp': datetime.now().isoformat()
-        }).execute()
-    except Exception as e:
-        logger.error(f"Critical logging error: {e}")
+    """Логирование ошибок бота: повторы схлопываются, в bot_logs - сводка раз в интервал"""
+    error_log.add(level, message)
 
 async def log_message(user_id: int, username: str, text: str, thread_id: Optional[int] = None):
-    """Логирование сообщений группы"""
-    await log_to_supabase('group_logs', {
+    """Логирование сообщений группы (пакетная запись через буфер)"""
+    await write_buffer.add('group_logs', {
         'user_id': user_id,
         'username': username,
         'text': text,
@@ -109,26 +315,76 @@ async def log_message(user_id: int, username: str, text: str, thread_id: Optiona
     })
 
 async def ensure_user_exists(user_id: int, username: str, first_name: str):
-    """Создание или обновление пользователя"""
+    """Создание или обновление пользователя (known user - без запросов к БД)"""
     try:
-        result = supabase.table('users').select('*').eq('user_id', user_id).execute()
-        if not result.data:
-            await log_to_supabase('users', {
-                'user_id': user_id,
-                'username': username,
-                'first_name': first_name,
-                'join_date': datetime.now().isoformat(),
-                'last_active': datetime.now().isoformat()
-            })
-        else:
-            supabase.table('users').update({
-                'last_active': datetime.now().isoformat()
-            }).eq('user_id', user_id).execute()
+        await user_cache.ensure(user_id, username, first_name)
     except Exception as e:
         logger.error(f"User processing error: {e}")
 
+async def fetch_growth_stats() -> tuple:
+    """Агрегаты роста считаются в БД (growth_stats), результат кэшируется на GROWTH_CACHE_TTL"""
+    if growth_cache['stats'] is None or time.monotonic() >= growth_cache['expires']:
+        result = await db.execute(db.rpc('growth_stats'))
+        # Функция возвращает таблицу из одной строки (postgrest-py ждет список)
+        growth_cache['stats'] = result.data[0]
+        growth_cache['computed_at'] = datetime.now()
+        growth_cache['expires'] = time.monotonic() + GROWTH_CACHE_TTL
+    return growth_cache['stats'], growth_cache['computed_at']
+
+def count_sentiment(text: str) -> list:
+    """Счетчики эмодзи [positive, negative, neutral] за один проход по тексту"""
+    counts = [0, 0, 0]
+    for match in EMOJI_PATTERN.findall(text):
+        counts[EMOJI_CLASS[match]] += 1
+    return counts
+
 # ============= HELPER FUNCTIONS =============
 
+def parse_db_timestamp(value: str) -> datetime:
+    """Время из Supabase -> наивное локальное время (как datetime.now())"""
+    ts = datetime.fromisoformat(value)
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+
+def timed_job(func):
+    """Замер длительности фоновой задачи"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - started
+            metrics.JOB_DURATION.labels(func.__name__).observe(duration)
+            logger.info(f"⏱ Job {func.__name__} finished in {duration:.2f}s")
+    return wrapper
+
+def reply(update: Update, text: str, **kwargs) -> asyncio.Future:
+    """Ответ на команду через очередь отправки (приоритетная полоса)"""
+    return sender.submit(update.effective_chat.id, REPLY, update.message.reply_text, text, **kwargs)
+
+def send_message(bot: Bot, priority: int = BROADCAST, **kwargs) -> asyncio.Future:
+    """Сообщение через очередь отправки с лимитами Telegram"""
+    return sender.submit(kwargs['chat_id'], priority, bot.send_message, **kwargs)
+
+def run_followup(coro):
+    """Продолжение обработчика в отдельной задаче: воркер апдейтов не ждет очереди отправки"""
+    task = asyncio.create_task(coro)
+    followup_tasks.add(task)
+    task.add_done_callback(followup_tasks.discard)
+
+async def throttle_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Группа -1: лимит частоты команд до их обработчиков; лишний вызов - короткий ответ вместо работы"""
+    if not update.message or not update.effective_user:
+        return
+    command = update.message.text.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+    delay = rate_limiter.check(update.effective_user.id, command)
+    if not delay:
+        return
+    metrics.RATE_LIMITED.labels(command).inc()
+    if rate_limiter.should_warn(update.effective_user.id, command, delay):
+        reply(update, f"⏳ Слишком часто. Повторите /{command} через {math.ceil(delay)} сек.")
+    raise ApplicationHandlerStop
+
 def is_admin(user_id: int) -> bool:
     """Проверка на админа"""
     return user_id in TELEGRAM_ADMIN_IDS
@@ -136,12 +392,13 @@ def is_admin(user_id: int) -> bool:
 async def admin_only(update: Update) -> bool:
     """Проверка админских прав"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("⛔ Команда только для администраторов.")
+        reply(update, "⛔ Команда только для администраторов.")
         return False
     return True
 
 # ============= КОМАНДЫ: СОЦИАЛЬНЫЕ =============
 
+@metrics.track_handler
 async def shoutout_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /shoutout @user причина"""
     if not await admin_only(update):
@@ -149,7 +406,8 @@ async def shoutout_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         if len(context.args) < 2:
-            await update.message.reply_text(
+            reply(
+                update,
                 "Использование: /shoutout @username причина благодарности"
             )
             return
@@ -165,19 +423,21 @@ async def shoutout_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         })
         
         message = f"🌟 <b>Shoutout!</b>\n\n@{username} получает благодарность за:\n<i>{reason}</i>\n\n— от {update.effective_user.first_name}"
-        await context.bot.send_message(
+        send_message(
+            context.bot,
             chat_id=TELEGRAM_CHAT_ID,
             message_thread_id=DISCUSSION_THREAD_ID,
             text=message,
             parse_mode=ParseMode.HTML
         )
         
-        await update.message.reply_text("✅ Shoutout опубликован!")
+        reply(update, "✅ Shoutout опубликован!")
         
     except Exception as e:
         logger.error(f"Shoutout error: {e}")
-        await update.message.reply_text("❌ Ошибка при публикации")
+        reply(update, "❌ Ошибка при публикации")
 
+@metrics.track_handler
 async def challenge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /challenge текст"""
     if not await admin_only(update):
@@ -185,37 +445,57 @@ async def challenge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         if not context.args:
-            await update.message.reply_text("Использование: /challenge описание челленджа")
+            reply(update, "Использование: /challenge описание челленджа")
             return
         
         challenge_text = ' '.join(context.args)
         
-        await log_to_supabase('challenges', {
-            'text': challenge_text,
-            'created_by': update.effective_user.id,
-            'created_at': datetime.now().isoformat(),
-            'is_active': True
-        })
-        
         message = f"🎯 <b>Новый челлендж недели!</b>\n\n{challenge_text}\n\nОтветьте на это сообщение с вашим решением!"
-        await context.bot.send_message(
+        post_sent = sender.submit(
+            TELEGRAM_CHAT_ID,
+            DIRECT,
+            context.bot.send_message,
             chat_id=TELEGRAM_CHAT_ID,
             message_thread_id=DISCUSSION_THREAD_ID,
             text=message,
             parse_mode=ParseMode.HTML
         )
+        # Пост в группу ждет своей очереди (20 сообщений в минуту): не держим воркер апдейтов
+        run_followup(finish_challenge(update, challenge_text, post_sent))
+        
+    except Exception as e:
+        logger.error(f"Challenge error: {e}")
+        reply(update, "❌ Ошибка при запуске")
+
+async def finish_challenge(update: Update, challenge_text: str, post_sent: asyncio.Future):
+    """Продолжение /challenge после отправки поста: строка челленджа и ответ админу"""
+    try:
+        post = await post_sent
+        # id поста сохраняется вместе с челленджем: по нему ответы привязываются к челленджу
+        result = await db.execute(
+            db.table('challenges').insert({
+                'text': challenge_text,
+                'created_by': update.effective_user.id,
+                'created_at': datetime.now().isoformat(),
+                'is_active': True,
+                'chat_id': post.chat_id,
+                'message_id': post.message_id
+            })
+        )
+        set_active_challenge(result.data[0])
         
-        await update.message.reply_text("✅ Челлендж запущен!")
+        reply(update, "✅ Челлендж запущен!")
         
     except Exception as e:
         logger.error(f"Challenge error: {e}")
-        await update.message.reply_text("❌ Ошибка при запуске")
+        reply(update, "❌ Ошибка при запуске")
 
+@metrics.track_handler
 async def network_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /network текст"""
     try:
         if not context.args:
-            await update.message.reply_text("Использование: /network ваш запрос на нетворкинг")
+            reply(update, "Использование: /network ваш запрос на нетворкинг")
             return
         
         network_text = ' '.join(context.args)
@@ -229,25 +509,30 @@ async def network_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         })
         
         message = f"🤝 <b>Запрос на нетворкинг</b>\n\nОт: {user.first_name} (@{user.username})\n\n{network_text}"
-        await context.bot.send_message(
+        send_message(
+            context.bot,
             chat_id=TELEGRAM_CHAT_ID,
             message_thread_id=NETWORK_THREAD_ID,
             text=message,
             parse_mode=ParseMode.HTML
         )
         
-        await update.message.reply_text("✅ Опубликовано в топике Нетворкинг!")
+        reply(update, "✅ Опубликовано в топике Нетворкинг!")
         
     except Exception as e:
         logger.error(f"Network error: {e}")
-        await update.message.reply_text("❌ Ошибка публикации")
+        reply(update, "❌ Ошибка публикации")
 
 # ============= КОМАНДЫ: ПИТЧИ =============
 
+@metrics.track_handler
 async def ratepitch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /ratepitch - создание опроса"""
     try:
-        message = await context.bot.send_poll(
+        poll_sent = sender.submit(
+            TELEGRAM_CHAT_ID,
+            DIRECT,
+            context.bot.send_poll,
             chat_id=TELEGRAM_CHAT_ID,
             message_thread_id=DISCUSSION_THREAD_ID,
             question="Оцените этот питч:",
@@ -255,39 +540,84 @@ async def ratepitch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             is_anonymous=False,
             allows_multiple_answers=False
         )
+        # Опрос в группу ждет своей очереди (20 сообщений в минуту): не держим воркер апдейтов
+        run_followup(finish_ratepitch(update, context.bot, poll_sent))
+        
+    except Exception as e:
+        logger.error(f"Ratepitch error: {e}")
+        reply(update, "❌ Ошибка создания опроса")
+
+async def finish_ratepitch(update: Update, bot: Bot, poll_sent: asyncio.Future):
+    """Продолжение /ratepitch после отправки опроса: строка в БД, таймер закрытия, ответ автору"""
+    try:
+        message = await poll_sent
         
-        active_pitches[message.poll.id] = {
+        now = datetime.now()
+        pitch_poll = {
+            'poll_id': message.poll.id,
             'message_id': message.message_id,
             'author_id': update.effective_user.id,
-            'created_at': datetime.now(),
             'chat_id': TELEGRAM_CHAT_ID,
-            'thread_id': DISCUSSION_THREAD_ID
+            'thread_id': DISCUSSION_THREAD_ID,
+            'created_at': now.isoformat(),
+            'close_at': (now + timedelta(hours=PITCH_POLL_HOURS)).isoformat()
         }
+        # Состояние опроса хранится в БД и переживает рестарт/редеплой
+        await log_to_supabase('pitch_polls', pitch_poll)
+        schedule_pitch_poll_close(bot, pitch_poll)
         
-        scheduler.add_job(
-            close_pitch_poll,
-            'date',
-            run_date=datetime.now() + timedelta(hours=24),
-            args=[context.bot, message.poll.id]
-        )
-        
-        await update.message.reply_text("✅ Опрос создан! Результаты через 24 часа.")
+        reply(update, f"✅ Опрос создан! Результаты через {PITCH_POLL_HOURS} часа.")
         
     except Exception as e:
         logger.error(f"Ratepitch error: {e}")
-        await update.message.reply_text("❌ Ошибка создания опроса")
+        reply(update, "❌ Ошибка создания опроса")
+
+def schedule_pitch_poll_close(bot, pitch_poll: Dict):
+    """Задача закрытия опроса в close_at (данные опроса передаются целиком)"""
+    scheduler.add_job(
+        close_pitch_poll,
+        'date',
+        run_date=parse_db_timestamp(pitch_poll['close_at']),
+        args=[bot, pitch_poll],
+        id=f"pitch_poll:{pitch_poll['poll_id']}",
+        replace_existing=True
+    )
 
-async def close_pitch_poll(bot, poll_id: str):
-    """Закрытие опроса через 24ч"""
+async def close_pitch_poll(bot, pitch_poll: Dict):
+    """Закрытие опроса через 24ч (ровно один раз, даже если таймер сработал на нескольких репликах)"""
     try:
-        if poll_id not in active_pitches:
+        # Сначала «захватываем» опрос: обновится строка только у того, кто успел первым
+        claimed = await db.execute(
+            db.table('pitch_polls')
+            .update({'closed_at': datetime.now().isoformat()})
+            .eq('poll_id', pitch_poll['poll_id'])
+            .is_('closed_at', 'null')
+        )
+        if not claimed.data:
             return
         
-        pitch_data = active_pitches[poll_id]
-        poll = await bot.stop_poll(
-            chat_id=pitch_data['chat_id'],
-            message_id=pitch_data['message_id']
-        )
+        try:
+            # Через очередь отправки: flood control и сетевые сбои она переживает сама
+            poll = await sender.submit(
+                pitch_poll['chat_id'],
+                DIRECT,
+                bot.stop_poll,
+                chat_id=pitch_poll['chat_id'],
+                message_id=pitch_poll['message_id']
+            )
+        except (BadRequest, Forbidden) as e:
+            # Опрос уже закрыт, сообщение удалено или бота убрали из чата - повторять бессмысленно
+            logger.warning(f"Poll {pitch_poll['poll_id']} cannot be stopped: {e}")
+            return
+        except (Exception, asyncio.CancelledError):
+            # Возвращаем захват (и при отмене из остановленной очереди), иначе опрос
+            # не закроет ни sweep_pitch_polls, ни другая реплика
+            await db.execute(
+                db.table('pitch_polls')
+                .update({'closed_at': None})
+                .eq('poll_id', pitch_poll['poll_id'])
+            )
+            raise
         
         total_votes = sum(option.voter_count for option in poll.options)
         if total_votes > 0:
@@ -295,80 +625,170 @@ async def close_pitch_poll(bot, poll_id: str):
             average_rating = weighted_sum / total_votes
             
             await log_to_supabase('pitch_ratings', {
-                'author_id': pitch_data['author_id'],
+                'author_id': pitch_poll['author_id'],
                 'average_rating': round(average_rating, 2),
                 'total_votes': total_votes,
                 'timestamp': datetime.now().isoformat()
             })
             
-            await bot.send_message(
-                chat_id=pitch_data['author_id'],
+            send_message(
+                bot,
+                priority=DIRECT,
+                chat_id=pitch_poll['author_id'],
                 text=f"📊 Результаты голосования:\n\n⭐ Средняя оценка: {average_rating:.1f}/5\n👥 Голосов: {total_votes}"
             )
         
-        del active_pitches[poll_id]
-        
     except Exception as e:
         logger.error(f"Close poll error: {e}")
 
+async def recover_pitch_polls(bot):
+    """Восстановление опросов после рестарта: просроченные закрываем, остальные ставим в планировщик"""
+    try:
+        result = await db.execute(
+            db.table('pitch_polls')
+            .select('poll_id', 'message_id', 'author_id', 'chat_id', 'thread_id', 'close_at')
+            .is_('closed_at', 'null')
+            .order('close_at')
+        )
+        
+        now = datetime.now()
+        overdue = []
+        for pitch_poll in result.data:
+            if parse_db_timestamp(pitch_poll['close_at']) <= now:
+                overdue.append(pitch_poll)
+            else:
+                schedule_pitch_poll_close(bot, pitch_poll)
+        for pitch_poll in overdue:
+            await close_pitch_poll(bot, pitch_poll)
+        
+        logger.info(f"✅ Pitch polls recovered: {len(overdue)} closed, {len(result.data) - len(overdue)} re-armed")
+        
+    except Exception as e:
+        logger.error(f"Pitch poll recovery error: {e}")
+
+@metrics.track_handler
 async def mentor_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /mentor тема"""
     try:
         if not context.args:
-            await update.message.reply_text("Использование: /mentor тема для менторства")
+            reply(update, "Использование: /mentor тема для менторства")
             return
         
-        topic = ' '.join(context.args).lower()
-        
-        mentors = {
-            'продукт': ['@mentor_product1', '@mentor_product2'],
-            'маркетинг': ['@mentor_marketing1'],
-            'технологии': ['@mentor_tech1', '@mentor_tech2'],
-            'финансы': ['@mentor_finance1'],
-            'продажи': ['@mentor_sales1']
-        }
-        
-        found_mentors = []
-        for key, values in mentors.items():
-            if key in topic:
-                found_mentors.extend(values)
+        topic = ' '.join(context.args)
+        if time.monotonic() - mentors_checked_at > MENTOR_REFRESH_INTERVAL:
+            await load_mentors()
         
+        found_mentors = mentor_directory.search(topic)
         if found_mentors:
-            message = f"🎓 <b>Менторы по теме '{topic}':</b>\n\n" + '\n'.join(found_mentors)
+            lines = [
+                f"{html.escape(m['name'] or '')} {html.escape(m['handle'])} — {html.escape(', '.join(m['topics']))}".strip()
+                for m, _ in found_mentors
+            ]
+            message = f"🎓 <b>Менторы по теме '{html.escape(topic)}':</b>\n\n" + '\n'.join(lines)
         else:
             message = "🤔 Менторы не найдены. Попробуйте уточнить запрос."
         
-        await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+        reply(update, message, parse_mode=ParseMode.HTML)
         
     except Exception as e:
         logger.error(f"Mentor error: {e}")
-        await update.message.reply_text("❌ Ошибка поиска")
+        reply(update, "❌ Ошибка поиска")
+
+@metrics.track_handler
+async def toppitches_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /toppitches - лидерборд питчей за месяц"""
+    if time.monotonic() - pitch_board_loaded_at > PITCH_BOARD_REFRESH:
+        await refresh_pitch_board()
+    top = pitch_board.top()
+    if not top:
+        reply(update, "📭 За последний месяц питчей с #pitch пока нет")
+        return
+    reply(
+        update,
+        f"🏆 <b>Топ питчей за {PITCH_WINDOW_DAYS} дней:</b>\n\n" + format_pitch_top(top),
+        parse_mode=ParseMode.HTML
+    )
+
+def format_pitch_top(top: List[Dict]) -> str:
+    """Нумерованный список питчей с лайками"""
+    lines = []
+    for i, pitch in enumerate(top, 1):
+        username = html.escape(pitch['username'] or 'Unknown')
+        text = html.escape(pitch['text'][:150])
+        lines.append(f"{i}. @{username} (❤️ {pitch['likes']})\n{text}...\n")
+    return '\n'.join(lines)
+
+async def refresh_pitch_board():
+    """Перечитать лайки, накопленные всеми репликами (сначала досылаем свои)"""
+    await write_buffer.flush()
+    await load_pitch_board()
+
+async def load_pitch_board():
+    """Загрузка питчей за окно (одним запросом): при старте и при обновлении"""
+    global pitch_board_loaded_at
+    try:
+        since = datetime.now() - timedelta(days=PITCH_WINDOW_DAYS)
+        result = await db.execute(
+            db.table('pitches')
+            .select('user_id', 'username', 'text', 'likes', 'timestamp', 'chat_id', 'message_id')
+            .gte('timestamp', since.isoformat())
+            .not_.is_('message_id', 'null')
+            .order('timestamp')
+        )
+        pitch_board.clear()
+        pitch_board_loaded_at = time.monotonic()
+        for pitch in result.data:
+            pitch_board.add(
+                (pitch['chat_id'], pitch['message_id']),
+                pitch['user_id'],
+                pitch['username'],
+                pitch['text'],
+                likes=pitch['likes'] or 0,
+                posted_at=parse_db_timestamp(pitch['timestamp'])
+            )
+        logger.info(f"✅ Pitch board loaded: {len(pitch_board)} pitches")
+    except Exception as e:
+        logger.error(f"Pitch board load error: {e}")
+
+async def load_mentors():
+    """Дочитывание каталога менторов: при старте - целиком, дальше - строки с updated_at >= последней виденной"""
+    global mentors_checked_at
+    try:
+        # >= а не >: строки с той же меткой, закоммиченные позже, не теряются; повторное применение безвредно
+        mentors_query = db.table('mentors').select('id', 'handle', 'name', 'topics', 'is_active', 'updated_at')
+        if mentor_directory.mentors_version:
+            mentors_query = mentors_query.gte('updated_at', mentor_directory.mentors_version)
+        synonyms_query = db.table('mentor_topic_synonyms').select('synonym', 'topic', 'updated_at')
+        if mentor_directory.synonyms_version:
+            synonyms_query = synonyms_query.gte('updated_at', mentor_directory.synonyms_version)
+        mentors_result, synonyms_result = await asyncio.gather(
+            db.execute(mentors_query), db.execute(synonyms_query)
+        )
+        mentor_directory.apply_synonyms(synonyms_result.data)
+        mentor_directory.apply_mentors(mentors_result.data)
+        mentors_checked_at = time.monotonic()
+    except Exception as e:
+        logger.error(f"Mentor directory load error: {e}")
 
 # ============= КОМАНДЫ: АНАЛИТИКА =============
 
+@metrics.track_handler
 async def growth_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /growth - статистика"""
     if not await admin_only(update):
         return
     
     try:
-        users_result = supabase.table('users').select('*').execute()
-        users = users_result.data
-        
-        total_users = len(users)
-        now = datetime.now()
-        week_ago = now - timedelta(days=7)
-        month_ago = now - timedelta(days=30)
+        stats, now = await fetch_growth_stats()
         
-        new_week = sum(1 for u in users if datetime.fromisoformat(u['join_date']) > week_ago)
-        new_month = sum(1 for u in users if datetime.fromisoformat(u['join_date']) > month_ago)
-        active_week = sum(1 for u in users if datetime.fromisoformat(u['last_active']) > week_ago)
+        total_users = stats['total_users']
+        new_week = stats['new_week']
+        new_month = stats['new_month']
+        active_week = stats['active_week']
+        messages_week = stats['messages_week']
         
         retention_7d = (active_week / total_users * 100) if total_users > 0 else 0
         
-        logs_result = supabase.table('group_logs').select('*').gte('timestamp', week_ago.isoformat()).execute()
-        messages_week = len(logs_result.data)
-        
         message = f"""
 📈 <b>Статистика Activat VC</b>
 
@@ -387,25 +807,52 @@ async def growth_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🕐 {now.strftime('%d.%m.%Y %H:%M')}
 """
         
-        await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+        reply(update, message, parse_mode=ParseMode.HTML)
         
     except Exception as e:
         logger.error(f"Growth error: {e}")
-        await update.message.reply_text("❌ Ошибка получения статистики")
+        reply(update, "❌ Ошибка получения статистики")
+
+@metrics.track_handler
+async def cohorts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /cohorts - удержание недельных когорт"""
+    if not await admin_only(update):
+        return
+    
+    try:
+        result = await db.call('cohort_activity', {'num_weeks': COHORT_WEEKS})
+        if not result.data:
+            reply(update, f"📭 За {COHORT_WEEKS} недель новых участников нет")
+            return
+        
+        row = result.data[0]
+        sizes, rates = retention_matrix(row['join_weeks'], row['active_masks'], COHORT_WEEKS)
+        table = render_table(datetime.fromisoformat(row['base_week']).date(), sizes, rates)
+        reply(
+            update,
+            f"📊 <b>Удержание когорт</b> (доля писавших на N-й неделе после вступления)\n\n<pre>{html.escape(table)}</pre>",
+            parse_mode=ParseMode.HTML
+        )
+        
+    except Exception as e:
+        logger.error(f"Cohorts error: {e}")
+        reply(update, "❌ Ошибка расчета когорт")
 
 # ============= КОМАНДЫ: ТЕХНИЧЕСКИЕ =============
 
+@metrics.track_handler
 async def restart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /restart"""
     if not await admin_only(update):
         return
     
     try:
-        await update.message.reply_text("🔄 Бот перезапускается...")
+        reply(update, "🔄 Бот перезапускается...")
         await log_bot_error('info', 'Bot restart initiated')
         
         # На Render рестарт происходит через Dashboard или Git push
-        await update.message.reply_text(
+        reply(
+            update,
             "✅ Для полного рестарта используйте:\n"
             "1. Render Dashboard → Manual Deploy\n"
             "2. Git push для автоматического деплоя"
@@ -414,43 +861,161 @@ async def restart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Restart error: {e}")
 
+@metrics.track_handler
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /export таблица с по [jsonl|csv] - выгрузка в личку админу"""
+    if not await admin_only(update):
+        return
+    
+    usage = (
+        "Использование: /export таблица ГГГГ-ММ-ДД ГГГГ-ММ-ДД [jsonl|csv]\n"
+        f"Таблицы: {', '.join(EXPORT_TABLES)}"
+    )
+    args = context.args or []
+    if len(args) not in (3, 4) or args[0] not in EXPORT_TABLES or (len(args) == 4 and args[3] not in FORMATS):
+        reply(update, usage)
+        return
+    try:
+        start = datetime.strptime(args[1], '%Y-%m-%d')
+        # Конечная дата включительно
+        end = datetime.strptime(args[2], '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        reply(update, usage)
+        return
+    table, fmt = args[0], args[3] if len(args) == 4 else 'jsonl'
+    
+    filename = f"{table}_{args[1]}_{args[2]}.{fmt}.gz"
+    path = Path(tempfile.gettempdir()) / f"{update.update_id}_{filename}"
+    try:
+        reply(update, f"⏳ Выгружаю {table} за {args[1]} — {args[2]}...")
+        total = await export_table(db, table, start, end, str(path), fmt=fmt, page_size=EXPORT_PAGE_SIZE)
+        if path.stat().st_size > TELEGRAM_DOCUMENT_LIMIT:
+            reply(update, "❌ Файл больше 50 МБ — сузьте период")
+            return
+        admin_id = update.effective_user.id
+        await sender.submit(
+            admin_id,
+            DIRECT,
+            context.bot.send_document,
+            chat_id=admin_id,
+            document=path,
+            filename=filename,
+            caption=f"📦 {table}: {total} строк"
+        )
+        
+    except Forbidden:
+        reply(update, "❌ Не могу написать в личку — отправьте боту /start")
+    except Exception as e:
+        logger.error(f"Export error: {e}")
+        reply(update, "❌ Ошибка выгрузки")
+    finally:
+        path.unlink(missing_ok=True)
+
+async def fetch_search_page(state: Dict) -> list:
+    """Страница полнотекстового поиска (GIN-индекс, курсор по (rank, id))"""
+    result = await db.execute(db.rpc('search_group_logs', {
+        'search_query': state['query'],
+        'filter_thread_id': state.get('thread_id'),
+        'cursor_rank': state.get('cursor_rank'),
+        'cursor_id': state.get('cursor_id'),
+        'page_size': SEARCH_PAGE_SIZE
+    }))
+    return result.data or []
+
+def render_search_page(state: Dict, rows: list):
+    """Текст страницы результатов и кнопка следующей страницы"""
+    query = html.escape(state['query'])
+    if not rows:
+        if state['shown']:
+            return f"🔍 Больше результатов по '{query}' нет", None
+        return f"❌ Ничего не найдено по '{query}'", None
+    
+    message = f"🔍 <b>Результаты по '{query}' ({state['shown'] + 1}-{state['shown'] + len(rows)}):</b>\n\n"
+    for i, msg in enumerate(rows, state['shown'] + 1):
+        username = html.escape(msg.get('username') or 'Unknown')
+        text = html.escape((msg.get('text') or '')[:100])
+        timestamp = datetime.fromisoformat(msg['timestamp']).strftime('%d.%m.%Y %H:%M')
+        message += f"{i}. @{username} ({timestamp}):\n{text}...\n\n"
+    
+    keyboard = None
+    if len(rows) == SEARCH_PAGE_SIZE:
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("➡️ Ещё", callback_data=f"search:{state['key']}")]])
+    return message, keyboard
+
+@metrics.track_handler
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Команда /search слово"""
+    """Команда /search [thread=ID] слово"""
     try:
         if not context.args:
-            await update.message.reply_text("Использование: /search ключевое слово")
+            reply(update, "Использование: /search [thread=ID] ключевое слово")
             return
         
-        search_term = ' '.join(context.args).lower()
-        
-        logs_result = supabase.table('group_logs')\
-            .select('*')\
-            .order('timestamp', desc=True)\
-            .limit(100)\
-            .execute()
-        
-        messages = logs_result.data
-        found = [
-            msg for msg in messages
-            if msg.get('text') and search_term in msg['text'].lower()
-        ][:5]
-        
-        if found:
-            message = f"🔍 <b>Найдено {len(found)} результатов по '{search_term}':</b>\n\n"
-            for i, msg in enumerate(found, 1):
-                username = msg.get('username', 'Unknown')
-                text = msg.get('text', '')[:100]
-                timestamp = datetime.fromisoformat(msg['timestamp']).strftime('%d.%m %H:%M')
-                message += f"{i}. @{username} ({timestamp}):\n{text}...\n\n"
-        else:
-            message = f"❌ Ничего не найдено по '{search_term}'"
+        args = list(context.args)
+        thread_id = None
+        if args[0].startswith('thread=') and args[0][len('thread='):].isdigit():
+            thread_id = int(args.pop(0)[len('thread='):])
+        if not args:
+            reply(update, "Использование: /search [thread=ID] ключевое слово")
+            return
+        
+        # Курсор привязан к конкретному поиску: в группе кнопки «Ещё» видят все
+        key = f"{update.effective_user.id}:{update.message.message_id}"
+        state = {'query': ' '.join(args), 'thread_id': thread_id, 'shown': 0, 'key': key}
+        rows = await fetch_search_page(state)
+        message, keyboard = render_search_page(state, rows)
         
-        await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+        if rows:
+            state['cursor_rank'] = rows[-1]['rank']
+            state['cursor_id'] = rows[-1]['id']
+            state['shown'] += len(rows)
+        searches = context.chat_data.setdefault('search', {})
+        searches[key] = state
+        # Храним только последние поиски чата
+        while len(searches) > SEARCH_STATES_PER_CHAT:
+            del searches[next(iter(searches))]
+        
+        reply(update, message, parse_mode=ParseMode.HTML, reply_markup=keyboard)
         
     except Exception as e:
         logger.error(f"Search error: {e}")
-        await update.message.reply_text("❌ Ошибка поиска")
+        reply(update, "❌ Ошибка поиска")
+
+@metrics.track_handler
+async def search_more_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка «Ещё» под результатами /search"""
+    query = update.callback_query
+    try:
+        key = query.data[len('search:'):]
+        if key.split(':', 1)[0] != str(query.from_user.id):
+            await query.answer("Листать может только автор поиска")
+            return
+        state = context.chat_data.get('search', {}).get(key)
+        if not state or 'cursor_id' not in state:
+            await query.answer("Поиск устарел, повторите /search")
+            return
+        
+        await query.answer()
+        rows = await fetch_search_page(state)
+        message, keyboard = render_search_page(state, rows)
+        
+        if rows:
+            state['cursor_rank'] = rows[-1]['rank']
+            state['cursor_id'] = rows[-1]['id']
+            state['shown'] += len(rows)
+        
+        sender.submit(
+            update.effective_chat.id,
+            REPLY,
+            query.edit_message_text,
+            message,
+            parse_mode=ParseMode.HTML,
+            reply_markup=keyboard
+        )
+        
+    except Exception as e:
+        logger.error(f"Search page error: {e}")
 
+@metrics.track_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /help"""
     help_text = """
@@ -459,7 +1024,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 <b>Для всех:</b>
 /network [текст] - нетворкинг
 /mentor [тема] - найти ментора
-/search [слово] - поиск в истории
+/search [слово] - поиск по всей истории
+/toppitches - лидерборд питчей
 /help - это сообщение
 
 <b>Только админы:</b>
@@ -467,26 +1033,48 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /challenge [текст] - челлендж недели
 /ratepitch - оценка питча
 /growth - статистика
+/cohorts - удержание когорт
+/export [таблица] [с] [по] - выгрузка истории
 /restart - перезапуск
 
 <b>Авто-функции:</b>
 • Архивация питчей с #pitch
+• Сохранение постов с #hiring, #event, #ask
 • Еженедельные отчеты
 • Анализ настроений
 • Топ-3 питчей месяца
 
 Присоединяйтесь к топикам! 🚀
 """
-    await update.message.reply_text(help_text, parse_mode=ParseMode.HTML)
+    reply(update, help_text, parse_mode=ParseMode.HTML)
 
+@metrics.track_handler
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
-    await update.message.reply_text(
+    reply(
+        update,
         "👋 Привет! Я бот Activat VC.\n\nИспользуйте /help для списка команд."
     )
 
 # ============= ОБРАБОТКА СООБЩЕНИЙ =============
 
+@timed_job
+async def sweep_pitch_polls(bot: Optional[Bot] = None):
+    """Закрытие просроченных опросов, чьи таймеры остались на другой реплике"""
+    bot = bot or telegram_bot
+    try:
+        result = await db.execute(
+            db.table('pitch_polls')
+            .select('poll_id', 'message_id', 'author_id', 'chat_id', 'thread_id', 'close_at')
+            .is_('closed_at', 'null')
+            .lte('close_at', datetime.now().astimezone().isoformat())
+        )
+        for pitch_poll in result.data:
+            await close_pitch_poll(bot, pitch_poll)
+    except Exception as e:
+        logger.error(f"Pitch poll sweep error: {e}")
+
+@metrics.track_handler
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка всех сообщений"""
     try:
@@ -499,30 +1087,179 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await ensure_user_exists(user.id, user.username or '', user.first_name or '')
         await log_message(user.id, user.username or '', message.text, message.message_thread_id)
         
-        if '#pitch' in message.text.lower():
-            await log_to_supabase('pitches', {
-                'user_id': user.id,
-                'username': user.username,
-                'text': message.text,
-                'timestamp': datetime.now().isoformat(),
-                'likes': 0
-            })
+        day = datetime.now().date().isoformat()
+        thread_id = message.message_thread_id or 0
+        activity_counters.add((day, thread_id, user.id), 1)
+        
+        sentiment = count_sentiment(message.text)
+        if any(sentiment):
+            sentiment_counters.add((day, thread_id), *sentiment)
+        
+        # Один проход по тексту для всех хэштегов
+        await tag_router.dispatch(message.text, message)
+        
+        # Ответ на питч засчитывается как лайк (кроме ответов самого автора), на пост челленджа - как ответ
+        if message.reply_to_message:
+            add_pitch_reply(message.reply_to_message, user.id)
+            await record_challenge_response(message)
         
     except Exception as e:
         logger.error(f"Message handling error: {e}")
 
+async def archive_pitch(tag: str, message):
+    """#pitch: в pitches (пакетно через буфер) и в лидерборд"""
+    user = message.from_user
+    await write_buffer.add('pitches', {
+        'user_id': user.id,
+        'username': user.username,
+        'text': message.text,
+        'timestamp': datetime.now().isoformat(),
+        'likes': 0,
+        'chat_id': message.chat_id,
+        'message_id': message.message_id
+    })
+    pitch_board.add((message.chat_id, message.message_id), user.id, user.username, message.text)
+
+async def archive_tagged_post(tag: str, message):
+    """#hiring, #event, #ask и др.: в tagged_posts (пакетно через буфер)"""
+    user = message.from_user
+    await write_buffer.add('tagged_posts', {
+        'tag': tag,
+        'user_id': user.id,
+        'username': user.username,
+        'text': message.text,
+        'thread_id': message.message_thread_id,
+        'chat_id': message.chat_id,
+        'message_id': message.message_id,
+        'timestamp': datetime.now().isoformat()
+    })
+
+tag_router.route('pitch', archive_pitch)
+for _tag in TAGGED_POST_TAGS:
+    tag_router.route(_tag, archive_tagged_post)
+
+async def record_challenge_response(message):
+    """Ответ на пост активного челленджа: в challenge_responses (пакетно через буфер)"""
+    target = message.reply_to_message
+    if not target.from_user or not target.from_user.is_bot:
+        return
+    key = (message.chat_id, target.message_id)
+    if (active_challenge is None or key != active_challenge['key']) \
+            and time.monotonic() - active_challenge_checked_at > CHALLENGE_REFRESH_INTERVAL:
+        # Ответ на незнакомое сообщение бота: челлендж могли запустить на другой реплике
+        await load_active_challenge()
+    if active_challenge is None or key != active_challenge['key']:
+        return
+    await write_buffer.add('challenge_responses', {
+        'challenge_id': active_challenge['id'],
+        'user_id': message.from_user.id,
+        'response_text': message.text,
+        'timestamp': datetime.now().isoformat()
+    })
+
+def set_active_challenge(row: Optional[Dict]):
+    global active_challenge, active_challenge_checked_at
+    active_challenge = {'id': row['id'], 'key': (row['chat_id'], row['message_id'])} if row else None
+    active_challenge_checked_at = time.monotonic()
+
+async def load_active_challenge():
+    """Последний активный челлендж с постом: при старте и при ответе на незнакомый пост бота"""
+    try:
+        result = await db.execute(
+            db.table('challenges')
+            .select('id', 'chat_id', 'message_id')
+            .eq('is_active', True)
+            .not_.is_('message_id', 'null')
+            .order('created_at', desc=True)
+            .limit(1)
+        )
+        set_active_challenge(result.data[0] if result.data else None)
+    except Exception as e:
+        logger.error(f"Active challenge load error: {e}")
+
+def add_pitch_like(chat_id: int, message_id: int, user_id: Optional[int], delta: int):
+    """Лайк питча: в памяти, если питч на доске, и всегда - в счетчик для пакетного инкремента в БД.
+    Реакции автора и на сообщения, которые так и не станут питчами, отсеивает БД"""
+    key = (chat_id, message_id)
+    author = pitch_board.author(key)
+    if author is not None and author == user_id:
+        return
+    pitch_board.like(key, delta)
+    pitch_likes.add((chat_id, message_id, user_id or 0), delta)
+
+def add_pitch_reply(target, user_id: int):
+    """Ответ на питч: не больше одного лайка от пользователя, как и у реакций.
+    Питч узнаем по доске или по хэштегу в тексте сообщения, на которое ответили"""
+    key = (target.chat_id, target.message_id)
+    if key in pitch_board:
+        if pitch_board.author(key) == user_id or not pitch_board.reply(key, user_id):
+            return
+    elif 'pitch' not in tag_router.match(target.text or '') or (
+            target.from_user and target.from_user.id == user_id):
+        return
+    pitch_reply_likes.add((target.chat_id, target.message_id, user_id), 1)
+
+@metrics.track_handler
+async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Реакция на сообщение: поставленная реакция +1 лайк питчу, снятая -1"""
+    try:
+        reaction = update.message_reaction
+        delta = bool(reaction.new_reaction) - bool(reaction.old_reaction)
+        if delta:
+            user_id = reaction.user.id if reaction.user else None
+            add_pitch_like(reaction.chat.id, reaction.message_id, user_id, delta)
+    except Exception as e:
+        logger.error(f"Reaction handling error: {e}")
+
+@metrics.track_handler
 async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка новых участников"""
+    """Обработка новых участников (приветствие копится WELCOME_WINDOW секунд)"""
+    global welcome_task
     try:
         for new_member in update.message.new_chat_members:
-            await ensure_user_exists(
-                new_member.id,
-                new_member.username or '',
-                new_member.first_name or ''
-            )
+            pending_joins[new_member.id] = {
+                'user_id': new_member.id,
+                'username': new_member.username or '',
+                'first_name': new_member.first_name or ''
+            }
+        
+        # Первый вход в окне запускает таймер, остальные просто дописываются
+        if welcome_task is None or welcome_task.done():
+            welcome_task = asyncio.create_task(delayed_welcome(context.bot))
             
-            welcome_msg = f"""
-👋 Добро пожаловать, {new_member.first_name}!
+    except Exception as e:
+        logger.error(f"New member error: {e}")
+
+async def delayed_welcome(bot: Bot):
+    """Приветствие после окна накопления"""
+    global welcome_task
+    await asyncio.sleep(WELCOME_WINDOW)
+    await welcome_pending_joins(bot)
+    # Вошедшие, пока шла регистрация, таймер не завели (этот еще не завершился) - новое окно для них
+    if pending_joins:
+        welcome_task = asyncio.create_task(delayed_welcome(bot))
+
+async def welcome_pending_joins(bot: Bot):
+    """Одна регистрация и одно приветствие на всех вошедших за окно"""
+    if not pending_joins:
+        return
+    members = list(pending_joins.values())
+    pending_joins.clear()
+    
+    try:
+        await user_cache.ensure_many(members)
+    except Exception as e:
+        logger.error(f"New members registration error: {e}")
+    
+    mentions = [
+        f'<a href="tg://user?id={m["user_id"]}">{html.escape(m["first_name"] or m["username"] or "участник")}</a>'
+        for m in members[:WELCOME_MAX_MENTIONS]
+    ]
+    if len(members) > WELCOME_MAX_MENTIONS:
+        mentions.append(f"и еще {len(members) - WELCOME_MAX_MENTIONS}")
+    
+    welcome_msg = f"""
+👋 Добро пожаловать, {', '.join(mentions)}!
 
 Мы рады видеть вас в Activat VC!
 
@@ -533,30 +1270,30 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 Присоединяйтесь к обсуждениям! 🚀
 """
-            await context.bot.send_message(
-                chat_id=TELEGRAM_CHAT_ID,
-                text=welcome_msg,
-                parse_mode=ParseMode.HTML
-            )
-            
-    except Exception as e:
-        logger.error(f"New member error: {e}")
+    send_message(
+        bot,
+        chat_id=TELEGRAM_CHAT_ID,
+        text=welcome_msg,
+        parse_mode=ParseMode.HTML
+    )
 
 # ============= АВТОМАТИЧЕСКИЕ ЗАДАЧИ =============
 
+@timed_job
 async def weekly_sentiment_analysis():
-    """Еженедельный анализ настроений"""
+    """Еженедельный анализ настроений (сумма дневных корзин, без перечитывания текстов)"""
     try:
         week_ago = datetime.now() - timedelta(days=7)
-        logs_result = supabase.table('group_logs').select('text').gte('timestamp', week_ago.isoformat()).execute()
-        
-        positive_emojis = ['😊', '😄', '🎉', '❤️', '👍', '🔥', '✨', '💪', '🚀', '⭐']
-        negative_emojis = ['😢', '😞', '😠', '👎', '💔', '😰']
-        neutral_emojis = ['🤔', '🙂', '😐']
+        await sentiment_counters.flush()
+        buckets_result = await db.execute(
+            db.table('sentiment_buckets')
+            .select('positive_count', 'negative_count', 'neutral_count')
+            .gt('day', week_ago.date().isoformat())
+        )
         
-        positive_count = sum(sum(msg.get('text', '').count(e) for e in positive_emojis) for msg in logs_result.data)
-        negative_count = sum(sum(msg.get('text', '').count(e) for e in negative_emojis) for msg in logs_result.data)
-        neutral_count = sum(sum(msg.get('text', '').count(e) for e in neutral_emojis) for msg in logs_result.data)
+        positive_count = sum(b['positive_count'] for b in buckets_result.data)
+        negative_count = sum(b['negative_count'] for b in buckets_result.data)
+        neutral_count = sum(b['neutral_count'] for b in buckets_result.data)
         
         total_emojis = positive_count + negative_count + neutral_count
         sentiment_score = ((positive_count - negative_count) / total_emojis * 100) if total_emojis > 0 else 0
@@ -576,32 +1313,35 @@ async def weekly_sentiment_analysis():
         logger.error(f"Sentiment error: {e}")
         await log_bot_error('error', f"Sentiment failed: {str(e)}")
 
-async def weekly_challenge_summary(bot):
+@timed_job
+async def weekly_challenge_summary(bot: Optional[Bot] = None):
     """Еженедельная сводка челленджа"""
+    bot = bot or telegram_bot
     try:
         week_ago = datetime.now() - timedelta(days=7)
-        challenges_result = supabase.table('challenges')\
-            .select('*')\
-            .eq('is_active', True)\
-            .gte('created_at', week_ago.isoformat())\
-            .execute()
+        challenges_result = await db.execute(
+            db.table('challenges')
+            .select('id', 'text')
+            .eq('is_active', True)
+            .gte('created_at', week_ago.isoformat())
+            .order('created_at', desc=True)
+        )
         
         if not challenges_result.data:
             return
+        challenge = challenges_result.data[0]
         
-        logs_result = supabase.table('group_logs')\
-            .select('*')\
-            .eq('thread_id', DISCUSSION_THREAD_ID)\
-            .gte('timestamp', week_ago.isoformat())\
-            .execute()
+        # Ответы лежат в буфере записи; считаем их на стороне базы одним запросом
+        await write_buffer.flush()
+        stats_result = await db.call('challenge_stats', {'target_challenge_id': challenge['id']})
         
-        response_count = len(logs_result.data)
-        participants = len(set(log['user_id'] for log in logs_result.data))
+        response_count = stats_result.data[0]['responses']
+        participants = stats_result.data[0]['participants']
         
         summary = f"""
 📊 <b>Итоги челленджа недели</b>
 
-🎯 {challenges_result.data[0]['text'][:100]}...
+🎯 {challenge['text'][:100]}...
 
 📈 <b>Результаты:</b>
 • Ответов: {response_count}
@@ -610,40 +1350,38 @@ async def weekly_challenge_summary(bot):
 Спасибо всем! 🎉
 """
         
-        await bot.send_message(
+        send_message(
+            bot,
             chat_id=TELEGRAM_CHAT_ID,
             message_thread_id=DISCUSSION_THREAD_ID,
             text=summary,
             parse_mode=ParseMode.HTML
         )
         
-        supabase.table('challenges').update({'is_active': False}).eq('id', challenges_result.data[0]['id']).execute()
+        await db.execute(
+            db.table('challenges').update({'is_active': False}).eq('id', challenge['id'])
+        )
+        if active_challenge is not None and active_challenge['id'] == challenge['id']:
+            set_active_challenge(None)
         
     except Exception as e:
         logger.error(f"Challenge summary error: {e}")
 
-async def monthly_pitch_archive(bot):
+@timed_job
+async def monthly_pitch_archive(bot: Optional[Bot] = None):
     """Ежемесячный топ-3 питчей"""
+    bot = bot or telegram_bot
     try:
-        month_ago = datetime.now() - timedelta(days=30)
-        pitches_result = supabase.table('pitches')\
-            .select('*')\
-            .gte('timestamp', month_ago.isoformat())\
-            .order('likes', desc=True)\
-            .limit(3)\
-            .execute()
-        
-        if not pitches_result.data:
+        # Топ поддерживается в памяти; перечитываем его, чтобы учесть лайки с других реплик
+        await refresh_pitch_board()
+        top = pitch_board.top(3)
+        if not top:
             return
         
-        message = "🏆 <b>Топ-3 питча месяца:</b>\n\n"
-        for i, pitch in enumerate(pitches_result.data, 1):
-            username = pitch.get('username', 'Unknown')
-            likes = pitch.get('likes', 0)
-            text = pitch.get('text', '')[:150]
-            message += f"{i}. @{username} (❤️ {likes})\n{text}...\n\n"
+        message = "🏆 <b>Топ-3 питча месяца:</b>\n\n" + format_pitch_top(top)
         
-        await bot.send_message(
+        send_message(
+            bot,
             chat_id=TELEGRAM_CHAT_ID,
             message_thread_id=DISCUSSION_THREAD_ID,
             text=message,
@@ -653,8 +1391,57 @@ async def monthly_pitch_archive(bot):
     except Exception as e:
         logger.error(f"Pitch archive error: {e}")
 
-async def check_bot_uptime(bot):
+async def ensure_log_partitions():
+    """Партиции group_logs на текущий и два следующих месяца"""
+    result = await db.call('ensure_group_logs_partitions', {'months_ahead': 2})
+    for row in result.data:
+        logger.info(f"✅ Created partition {row['partition_name']}")
+
+@timed_job
+async def archive_group_logs():
+    """Выгрузка партиций group_logs старше GROUP_LOGS_RETENTION_MONTHS в бакет и их удаление"""
+    try:
+        await ensure_log_partitions()
+        
+        if not ARCHIVE_BUCKET:
+            # Локальный диск Render не переживает редеплой: без бакета удалять историю нельзя
+            logger.warning("ARCHIVE_BUCKET is not set: old group_logs partitions are kept")
+            return
+        
+        cutoff = datetime.now().astimezone() - timedelta(days=31 * GROUP_LOGS_RETENTION_MONTHS)
+        result = await db.call('list_group_logs_partitions')
+        for partition in result.data:
+            range_end = datetime.fromisoformat(partition['range_end'])
+            if range_end > cutoff:
+                continue
+            
+            name = partition['partition_name']
+            filename = f"{name}.jsonl.gz"
+            path = Path(tempfile.gettempdir()) / filename
+            try:
+                total = await export_table(
+                    db,
+                    'group_logs',
+                    datetime.fromisoformat(partition['range_start']),
+                    range_end,
+                    str(path),
+                    page_size=EXPORT_PAGE_SIZE
+                )
+                await db.upload(ARCHIVE_BUCKET, f"group_logs/{filename}", str(path))
+                # Удаляем только после того, как бакет подтвердил архив
+                await db.call('drop_group_logs_partition', {'partition_name': name})
+                logger.info(f"✅ Archived {name}: {total} rows")
+            finally:
+                path.unlink(missing_ok=True)
+        
+    except Exception as e:
+        logger.error(f"Group logs archive error: {e}")
+        await log_bot_error('error', f"Group logs archive failed: {str(e)}")
+
+@timed_job
+async def check_bot_uptime(bot: Optional[Bot] = None):
     """Проверка uptime каждые 5 минут"""
+    bot = bot or telegram_bot
     try:
         me = await bot.get_me()
         logger.info(f"Uptime check: Bot {me.username} is alive")
@@ -664,90 +1451,254 @@ async def check_bot_uptime(bot):
 
 # ============= SCHEDULER =============
 
+def on_job_missed(event):
+    """Запуск пропущен дольше, чем допускает misfire_grace_time"""
+    logger.warning(f"⚠️ Job {event.job_id} missed its run at {event.scheduled_run_time}")
+
+def sync_persistent_job(func, trigger, job_id: str, misfire_grace_time: int):
+    """Регистрация задачи в постоянном хранилище без сброса пропущенного запуска"""
+    job = scheduler.get_job(job_id, jobstore='persistent')
+    if job is not None and str(job.trigger) == str(trigger):
+        # Расписание не менялось: сохраняем next_run_time, чтобы пропущенный запуск догнался
+        scheduler.modify_job(job_id, 'persistent', func=func, args=(), misfire_grace_time=misfire_grace_time)
+        return
+    scheduler.add_job(
+        func,
+        trigger,
+        id=job_id,
+        jobstore='persistent',
+        misfire_grace_time=misfire_grace_time,
+        replace_existing=True
+    )
+
 def setup_scheduler(application: Application):
     """Настройка планировщика"""
+    global telegram_bot
+    telegram_bot = application.bot
     
-    scheduler.add_job(
+    # Стартуем на паузе: сначала сверяем задачи с хранилищем, потом догоняем пропущенное
+    scheduler.add_listener(on_job_missed, EVENT_JOB_MISSED)
+    scheduler.start(paused=True)
+    
+    sync_persistent_job(
         weekly_sentiment_analysis,
         CronTrigger(day_of_week='mon', hour=10, minute=0),
-        id='weekly_sentiment'
+        'weekly_sentiment',
+        misfire_grace_time=SCHEDULER_WEEKLY_GRACE
     )
     
-    scheduler.add_job(
+    sync_persistent_job(
         weekly_challenge_summary,
         CronTrigger(day_of_week='sun', hour=20, minute=0),
-        args=[application.bot],
-        id='weekly_challenge'
+        'weekly_challenge',
+        misfire_grace_time=SCHEDULER_WEEKLY_GRACE
     )
     
-    scheduler.add_job(
+    sync_persistent_job(
         monthly_pitch_archive,
         CronTrigger(day=1, hour=12, minute=0),
-        args=[application.bot],
-        id='monthly_pitches'
+        'monthly_pitches',
+        misfire_grace_time=SCHEDULER_MONTHLY_GRACE
     )
     
-    scheduler.add_job(
+    sync_persistent_job(
+        archive_group_logs,
+        CronTrigger(day=2, hour=4, minute=0),
+        'archive_group_logs',
+        misfire_grace_time=SCHEDULER_MONTHLY_GRACE
+    )
+    
+    sync_persistent_job(
+        sweep_pitch_polls,
+        IntervalTrigger(minutes=1),
+        'pitch_poll_sweep',
+        misfire_grace_time=60
+    )
+    
+    sync_persistent_job(
         check_bot_uptime,
-        'interval',
-        minutes=5,
-        args=[application.bot],
-        id='uptime_check'
+        IntervalTrigger(minutes=5),
+        'uptime_check',
+        misfire_grace_time=60
     )
     
-    scheduler.start()
-    logger.info("✅ Scheduler started")
+    # Задачи запускаются, только когда эта реплика станет лидером (post_init)
+    logger.info("✅ Scheduler configured (paused until leadership)")
+
+async def on_elected():
+    """Реплика стала лидером - запускаем cron-задачи"""
+    if scheduler.running:
+        scheduler.resume()
+
+async def on_demoted():
+    """Аренду забрала другая реплика - останавливаем задачи"""
+    if scheduler.running:
+        scheduler.pause()
 
 # ============= INITIALIZATION =============
 
 async def post_init(application: Application):
     """Инициализация после запуска"""
+    global http_server, elector
+    metrics.register_queue('updates', application.update_queue.qsize)
+    metrics.register_queue('write_buffer', lambda: write_buffer.pending)
+    metrics.register_queue('send_queue', lambda: sender.pending)
+    metrics.register_queue('db_spool', lambda: db.spool.pending)
+    
+    if BOT_MODE == 'webhook' or HTTP_SERVER_ENABLED:
+        http_server = WebhookServer(
+            application,
+            port=PORT,
+            path=WEBHOOK_PATH if BOT_MODE == 'webhook' else None,
+            secret_token=WEBHOOK_SECRET,
+            max_queue=WEBHOOK_MAX_QUEUE
+        )
+        await http_server.start()
+    
+    await db.spool.start()
+    await write_buffer.start()
+    await sender.start()
+    await recover_pitch_polls(application.bot)
+    await load_pitch_board()
+    await load_mentors()
+    logger.info(f"✅ Mentor directory loaded: {len(mentor_directory)} mentors")
+    await load_active_challenge()
+    try:
+        await ensure_log_partitions()
+    except Exception as e:
+        logger.error(f"Partition check error: {e}")
+    
+    elector = LeaderElector(
+        LeaderLease(LEADER_DB_URL, ttl=LEADER_LEASE_TTL),
+        on_elected=on_elected,
+        on_demoted=on_demoted
+    )
+    await elector.start()
     await log_bot_error('info', 'Bot started on Render')
     logger.info("✅ Bot initialized successfully")
 
+async def post_stop(application: Application):
+    """После остановки обработки апдейтов, пока HTTP-клиент бота еще открыт"""
+    # Не теряем приветствие тех, кто вошел прямо перед остановкой
+    if welcome_task is not None and not welcome_task.done():
+        welcome_task.cancel()
+    await welcome_pending_joins(application.bot)
+    # Досылаем очередь отправки: после Application.shutdown() запросы к Bot API уже невозможны
+    await sender.stop()
+    # Недосланные вызовы отменены остановкой очереди - их продолжения завершаются сразу
+    await asyncio.gather(*followup_tasks, return_exceptions=True)
+
+async def post_shutdown(application: Application):
+    """Освобождение ресурсов при остановке"""
+    # Отдаем аренду сразу, чтобы другая реплика не ждала ее истечения
+    if elector is not None:
+        await elector.stop()
+    if http_server is not None:
+        await http_server.stop()
+    await error_log.flush(force=True)
+    # Сначала дописываем буфер, потом закрываем пул соединений
+    await write_buffer.stop()
+    await db.spool.stop()
+    await db.close()
+    logger.info("✅ Bot shut down cleanly")
+
 # ============= MAIN =============
 
-def main():
-    """Основная функция"""
-    
-    logger.info("🚀 Starting Activat VC Bot on Render.com")
-    logger.info(f"📍 Chat ID: {TELEGRAM_CHAT_ID}")
-    logger.info(f"👮 Admins: {len(TELEGRAM_ADMIN_IDS)}")
+async def run_webhook(application: Application):
+    """Webhook-режим: aiohttp-сервер на PORT (поднимается в post_init), апдейты обрабатываются пулом Application"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
     
+    async with application:
+        await post_init(application)
+        await application.start()
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+            # Апдейты, накопленные за время rolling-рестарта, Telegram доставит новой реплике
+            drop_pending_updates=False
+        )
+        logger.info("✅ Webhook registered")
+        
+        await stop_event.wait()
+        
+        # Сначала перестаем принимать апдейты: принятый с 200 апдейт Telegram не пришлет повторно,
+        # а после application.stop() его уже некому обработать
+        await http_server.stop()
+        await application.stop()
+        await post_stop(application)
+    await post_shutdown(application)
+
+def build_application() -> Application:
+    """Приложение со всеми обработчиками (используется также в benchmark.py)"""
     # Создаем приложение БЕЗ JobQueue (используем только APScheduler)
     # job_queue=False критически важно для Python 3.14+
-    application = (
+    builder = (
         Application.builder()
         .token(TELEGRAM_BOT_TOKEN)
         .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
         .job_queue(None)  # КРИТИЧНО: отключаем встроенный JobQueue
-        .concurrent_updates(True)
-        .build()
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))  # замер задержек Bot API
+        .concurrent_updates(UPDATE_WORKERS)  # ограниченный пул параллельной обработки
     )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+    application = builder.build()
     
-    # Регистрируем обработчики
+    # Регистрируем обработчики; лимит частоты срабатывает раньше всех команд
+    application.add_handler(MessageHandler(filters.COMMAND, throttle_commands), group=-1)
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("shoutout", shoutout_command))
     application.add_handler(CommandHandler("challenge", challenge_command))
     application.add_handler(CommandHandler("network", network_command))
     application.add_handler(CommandHandler("ratepitch", ratepitch_command))
+    application.add_handler(CommandHandler("toppitches", toppitches_command))
     application.add_handler(CommandHandler("mentor", mentor_command))
     application.add_handler(CommandHandler("growth", growth_command))
+    application.add_handler(CommandHandler("cohorts", cohorts_command))
     application.add_handler(CommandHandler("restart", restart_command))
+    application.add_handler(CommandHandler("export", export_command))
     application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CallbackQueryHandler(search_more_callback, pattern='^search:'))
     
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, handle_new_member))
+    application.add_handler(MessageReactionHandler(
+        handle_reaction,
+        message_reaction_types=MessageReactionHandler.MESSAGE_REACTION_UPDATED
+    ))
+    
+    return application
+
+def main():
+    """Основная функция"""
+    
+    logger.info("🚀 Starting Activat VC Bot on Render.com")
+    logger.info(f"📍 Chat ID: {TELEGRAM_CHAT_ID}")
+    logger.info(f"👮 Admins: {len(TELEGRAM_ADMIN_IDS)}")
+    
+    application = build_application()
     
     # Настраиваем планировщик
     setup_scheduler(application)
     
+    if BOT_MODE == 'webhook':
+        logger.info(f"✅ Starting webhook mode on port {PORT}")
+        # Тот же event loop, к которому уже привязан планировщик
+        asyncio.get_event_loop().run_until_complete(run_webhook(application))
+        return
+    
     logger.info("✅ Starting polling mode (optimal for Render free tier)")
     
     # Запускаем бота в polling режиме (оптимально для Render)
     application.run_polling(
-        allowed_updates=Update.ALL_TYPES,
+        allowed_updates=ALLOWED_UPDATES,
         drop_pending_updates=True
     )
 
@@ -0,0 +1,123 @@
+"""
+Activat VC Bot - каталог менторов
+Инвертированный индекс по темам и синонимам: легкий стемминг для русского,
+нечеткое совпадение по триграммам, инкрементальное обновление по updated_at
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_WORD = re.compile(r'[\w+#]+')
+# Окончания от длинных к коротким; основа не короче MIN_STEM букв
+_SUFFIXES = sorted((
+    'ами', 'ями', 'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ого', 'его', 'ому', 'ему', 'ым', 'им', 'ах', 'ях', 'ом', 'ем', 'ам', 'ям',
+    'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь', 'й',
+    'ing', 'ers', 'er', 's'
+), key=len, reverse=True)
+MIN_STEM = 4
+
+
+def stem(word: str) -> str:
+    """Грубая основа слова: нижний регистр, ё -> е, без типичного окончания"""
+    word = word.lower().replace('ё', 'е')
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokens(text: str) -> List[str]:
+    return [stem(w) for w in _WORD.findall(text)]
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MentorDirectory:
+    """Менторы в памяти: термин -> id менторов, триграмма -> термины"""
+
+    def __init__(self, fuzzy_threshold: float = 0.45):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.mentors: Dict[int, dict] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._grams: Dict[str, Set[str]] = defaultdict(set)
+        # стем синонима -> стемы тем
+        self._synonyms: Dict[str, Set[str]] = defaultdict(set)
+        self.mentors_version: Optional[str] = None
+        self.synonyms_version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.mentors)
+
+    def apply_mentors(self, rows: Iterable[dict]):
+        """Добавление или замена менторов (строки mentors); неактивные удаляются из индекса"""
+        for row in rows:
+            self._remove(row['id'])
+            if row.get('is_active', True):
+                self.mentors[row['id']] = row
+                for term in self._mentor_terms(row):
+                    if term not in self._postings:
+                        for gram in trigrams(term):
+                            self._grams[gram].add(term)
+                    self._postings[term].add(row['id'])
+            self.mentors_version = max(self.mentors_version or '', row['updated_at'])
+
+    def apply_synonyms(self, rows: Iterable[dict]):
+        """Добавление синонимов (строки mentor_topic_synonyms)"""
+        for row in rows:
+            for synonym in tokens(row['synonym']):
+                self._synonyms[synonym].update(tokens(row['topic']))
+            self.synonyms_version = max(self.synonyms_version or '', row['updated_at'])
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[dict, float]]:
+        """Менторы по убыванию релевантности: точное совпадение темы - 1, нечеткое - сходство триграмм"""
+        scores: Dict[int, float] = defaultdict(float)
+        for word in tokens(query):
+            for term, weight in self._expand(word).items():
+                for mentor_id in self._postings.get(term, ()):
+                    scores[mentor_id] += weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.mentors[item[0]]['handle']))
+        return [(self.mentors[mentor_id], score) for mentor_id, score in ranked[:limit]]
+
+    def _expand(self, word: str) -> Dict[str, float]:
+        """Слово запроса -> термины индекса с весами (синонимы и нечеткие совпадения)"""
+        words = {word} | self._synonyms.get(word, set())
+        matches: Dict[str, float] = {}
+        for w in words:
+            if w in self._postings:
+                matches[w] = 1.0
+                continue
+            grams = trigrams(w)
+            candidates: Set[str] = set()
+            for gram in grams:
+                candidates |= self._grams.get(gram, set())
+            for term in candidates:
+                term_grams = trigrams(term)
+                similarity = len(grams & term_grams) / len(grams | term_grams)
+                if similarity >= self.fuzzy_threshold:
+                    matches[term] = max(matches.get(term, 0), similarity)
+        return matches
+
+    def _mentor_terms(self, row: dict) -> Set[str]:
+        terms: Set[str] = set()
+        for topic in row.get('topics') or []:
+            terms.update(tokens(topic))
+        return terms
+
+    def _remove(self, mentor_id: int):
+        row = self.mentors.pop(mentor_id, None)
+        if row is None:
+            return
+        for term in self._mentor_terms(row):
+            ids = self._postings.get(term)
+            if ids is None:
+                continue
+            ids.discard(mentor_id)
+            if not ids:
+                del self._postings[term]
+                for gram in trigrams(term):
+                    self._grams[gram].discard(term)
@@ -0,0 +1,91 @@
+"""
+Activat VC Bot - метрики
+Prometheus-метрики: задержки обработчиков, запросы к БД и Telegram, очереди, задачи
+"""
+
+import functools
+import time
+from typing import Callable, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from telegram.request import HTTPXRequest
+
+HANDLER_LATENCY = Histogram(
+    'bot_handler_duration_seconds',
+    'Время обработки апдейта',
+    ['handler']
+)
+DB_REQUESTS = Counter(
+    'bot_db_requests_total',
+    'Запросы к Supabase',
+    ['table', 'method', 'status']
+)
+DB_LATENCY = Histogram(
+    'bot_db_request_duration_seconds',
+    'Время запроса к Supabase',
+    ['table', 'method']
+)
+DB_CIRCUIT_OPEN = Gauge(
+    'bot_db_circuit_open',
+    'Circuit breaker базы открыт (1) или закрыт (0)'
+)
+IS_LEADER = Gauge(
+    'bot_scheduler_leader',
+    'Реплика держит аренду планировщика (1) или нет (0)'
+)
+RATE_LIMITED = Counter(
+    'bot_rate_limited_total',
+    'Команды, отклоненные лимитом частоты',
+    ['command']
+)
+TELEGRAM_LATENCY = Histogram(
+    'bot_telegram_request_duration_seconds',
+    'Время запроса к Bot API',
+    ['method']
+)
+QUEUE_DEPTH = Gauge(
+    'bot_queue_depth',
+    'Текущая длина внутренних очередей',
+    ['queue']
+)
+JOB_DURATION = Histogram(
+    'bot_job_duration_seconds',
+    'Длительность фоновых задач планировщика',
+    ['job'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+
+def track_handler(func):
+    """Гистограмма задержки для обработчика апдейтов"""
+    histogram = HANDLER_LATENCY.labels(func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def register_queue(name: str, depth: Callable[[], int]):
+    """Длина очереди снимается в момент чтения /metrics"""
+    QUEUE_DEPTH.labels(name).set_function(depth)
+
+
+def render() -> Tuple[bytes, str]:
+    """Текст в формате Prometheus и его content-type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest с замером времени каждого метода Bot API"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            TELEGRAM_LATENCY.labels(url.rsplit('/', 1)[-1]).observe(time.perf_counter() - started)
@@ -0,0 +1,104 @@
+"""
+Activat VC Bot - рейтинг питчей
+Лайки питчей (реакции и ответы) считаются в памяти; топ-N поддерживается
+при каждом изменении, поэтому лидерборд и месячный архив не читают таблицу
+"""
+
+import heapq
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+PitchKey = Tuple[int, int]  # (chat_id, message_id)
+
+
+class PitchBoard:
+    """Питчи за последние window_days и их топ-N по лайкам"""
+
+    def __init__(self, top_size: int = 10, window_days: int = 30):
+        self.top_size = top_size
+        self.window = timedelta(days=window_days)
+        self._pitches: Dict[PitchKey, dict] = {}
+        # Ключи в порядке публикации - для дешевого вытеснения устаревших
+        self._order: Deque[Tuple[datetime, PitchKey]] = deque()
+        self._top: List[PitchKey] = []
+
+    def __len__(self) -> int:
+        return len(self._pitches)
+
+    def __contains__(self, key: PitchKey) -> bool:
+        return key in self._pitches
+
+    def clear(self):
+        """Сброс перед перезагрузкой из БД"""
+        self._pitches.clear()
+        self._order.clear()
+        self._top.clear()
+
+    def author(self, key: PitchKey) -> Optional[int]:
+        pitch = self._pitches.get(key)
+        return pitch['user_id'] if pitch else None
+
+    def add(self, key: PitchKey, user_id: int, username: Optional[str], text: str, likes: int = 0,
+            posted_at: Optional[datetime] = None):
+        """Новый питч (или загруженный из БД при старте); порядок добавления - по времени"""
+        posted_at = posted_at or datetime.now()
+        self._pitches[key] = {
+            'user_id': user_id,
+            'username': username,
+            'text': text[:300],
+            'likes': likes,
+            'posted_at': posted_at,
+            # Кто уже ответил на питч: ответ засчитывается как лайк один раз
+            'repliers': set()
+        }
+        self._order.append((posted_at, key))
+        self._promote(key)
+
+    def like(self, key: PitchKey, delta: int = 1) -> bool:
+        """Изменение лайков питча; False - питч не отслеживается"""
+        pitch = self._pitches.get(key)
+        if pitch is None:
+            return False
+        pitch['likes'] = max(0, pitch['likes'] + delta)
+        if delta < 0 and key in self._top:
+            # Участник топа мог опуститься ниже кого-то вне топа
+            self._rebuild()
+        else:
+            self._promote(key)
+        return True
+
+    def reply(self, key: PitchKey, user_id: int) -> bool:
+        """Ответ на питч: лайк только за первый ответ пользователя; False - не засчитан"""
+        pitch = self._pitches.get(key)
+        if pitch is None or user_id in pitch['repliers']:
+            return False
+        pitch['repliers'].add(user_id)
+        return self.like(key)
+
+    def top(self, limit: Optional[int] = None) -> List[dict]:
+        """Топ по лайкам за окно (limit <= top_size)"""
+        self._expire(datetime.now() - self.window)
+        return [{**self._pitches[key], 'key': key} for key in self._top[:limit or self.top_size]]
+
+    def _promote(self, key: PitchKey):
+        likes = self._pitches[key]['likes']
+        if key not in self._top:
+            if len(self._top) >= self.top_size and likes <= self._pitches[self._top[-1]]['likes']:
+                return
+            self._top.append(key)
+        # Топ маленький: сортировка вставкой дешевле кучи
+        self._top.sort(key=lambda k: self._pitches[k]['likes'], reverse=True)
+        del self._top[self.top_size:]
+
+    def _rebuild(self):
+        self._top = heapq.nlargest(self.top_size, self._pitches, key=lambda k: self._pitches[k]['likes'])
+
+    def _expire(self, cutoff: datetime):
+        expired = False
+        while self._order and self._order[0][0] < cutoff:
+            _, key = self._order.popleft()
+            if self._pitches.pop(key, None) is not None and key in self._top:
+                expired = True
+        if expired:
+            self._rebuild()
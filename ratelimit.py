@@ -0,0 +1,78 @@
+"""
+Activat VC Bot - ограничение частоты команд
+Token bucket на пару (пользователь, команда): дорогие команды не выбирают квоту
+Supabase и лимиты рассылки; полные (простаивающие) корзины вытесняются
+"""
+
+import time
+from typing import Dict, Optional, Tuple
+
+from sender import TokenBucket
+
+Key = Tuple[int, str]  # (user_id, command)
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, float]]:
+    """'search=5/60,growth=3/60' -> {'search': (5, 60.0), ...}: не больше N вызовов за период (сек)"""
+    limits: Dict[str, Tuple[int, float]] = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        command, _, rule = item.partition('=')
+        calls, _, period = rule.partition('/')
+        limits[command.strip().lstrip('/').lower()] = (int(calls), float(period))
+    return limits
+
+
+class CommandRateLimiter:
+    """Корзины создаются при первом вызове; полная корзина неотличима от новой и удаляется без потерь"""
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]], max_buckets: int = 50000, sweep_interval: float = 300.0):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[Key, TokenBucket] = {}
+        # Кому уже ответили «подождите» - до какого момента
+        self._warned: Dict[Key, float] = {}
+        self._swept_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def check(self, user_id: int, command: str, now: Optional[float] = None) -> float:
+        """0 - вызов разрешен (токен списан), иначе секунд до следующего токена"""
+        limit = self.limits.get(command)
+        if limit is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        if now - self._swept_at > self.sweep_interval:
+            self._sweep(now)
+
+        key = (user_id, command)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                # Лимит между чистками: вытесняем самую старую корзину (словарь хранит порядок вставки)
+                del self._buckets[next(iter(self._buckets))]
+            calls, period = limit
+            bucket = self._buckets[key] = TokenBucket(calls / period, calls)
+            bucket.updated = now
+        delay = bucket.delay(now)
+        if delay == 0:
+            bucket.consume()
+            self._warned.pop(key, None)
+        return delay
+
+    def should_warn(self, user_id: int, command: str, delay: float, now: Optional[float] = None) -> bool:
+        """Один ответ «подождите» на период блокировки: повторный спам отбрасывается молча"""
+        now = time.monotonic() if now is None else now
+        key = (user_id, command)
+        if self._warned.get(key, 0.0) > now:
+            return False
+        self._warned[key] = now + delay
+        return True
+
+    def _sweep(self, now: float):
+        self._swept_at = now
+        self._buckets = {key: b for key, b in self._buckets.items() if not b.is_full(now)}
+        self._warned = {key: until for key, until in self._warned.items() if until > now}
@@ -0,0 +1,216 @@
+"""
+Activat VC Bot - очередь отправки
+Все исходящие сообщения идут через планировщик с лимитами Telegram:
+глобальный и per-chat token bucket, приоритетные полосы, back-off на 429
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Приоритетные полосы: ответы на команды раньше рассылок
+REPLY = 0
+DIRECT = 1
+BROADCAST = 2
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена (0 - можно сейчас)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _Outgoing:
+    __slots__ = ('chat_id', 'priority', 'func', 'args', 'kwargs', 'future', 'attempt')
+
+    def __init__(self, chat_id: int, priority: int, func: Callable, args: tuple, kwargs: dict, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempt = 0
+
+
+class SendQueue:
+    """Очередь исходящих вызовов Bot API с лимитами и повторными попытками"""
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        group_rate: float = 20 / 60,
+        group_burst: int = 3,
+        private_rate: float = 1.0,
+        max_retries: int = 3,
+        max_concurrency: int = 8,
+        max_buckets: int = 10000
+    ):
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self.max_buckets = max_buckets
+
+        self._lanes: List[Deque[_Outgoing]] = [deque(), deque(), deque()]
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Сообщений в очереди и в процессе отправки"""
+        return sum(len(lane) for lane in self._lanes) + self._in_flight
+
+    def submit(self, chat_id: int, priority: int, func: Callable, /, *args, **kwargs) -> asyncio.Future:
+        """Поставить вызов func(*args, **kwargs) в полосу priority; результат - во future"""
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка уже залогирована очередью; не ругаемся, если future никто не ждет
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._lanes[priority].append(_Outgoing(chat_id, priority, func, args, kwargs, future))
+        self._wakeup.set()
+        return future
+
+    async def start(self):
+        """Запуск цикла отправки"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Send queue started")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дослать очередь (не дольше timeout) и остановить цикл"""
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for lane in self._lanes:
+            while lane:
+                lane.popleft().future.cancel()
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_buckets:
+                now = time.monotonic()
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.is_full(now)}
+            # Отрицательные id - группы (20 сообщений в минуту), положительные - личка (1 в секунду)
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, 1)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _next_ready(self, now: float):
+        """Первый по приоритету вызов, для которого есть токены; иначе - сколько ждать"""
+        wait = self._paused_until - now
+        if wait > 0:
+            return None, wait
+        wait = self._global.delay(now)
+        if wait > 0:
+            return None, wait
+
+        best_wait = None
+        blocked = set()
+        for lane in self._lanes:
+            for index, item in enumerate(lane):
+                if item.chat_id in blocked:
+                    continue
+                chat_wait = self._bucket(item.chat_id).delay(now)
+                if chat_wait == 0:
+                    del lane[index]
+                    return item, 0.0
+                blocked.add(item.chat_id)
+                best_wait = chat_wait if best_wait is None else min(best_wait, chat_wait)
+        return None, best_wait
+
+    async def _run(self):
+        while True:
+            item, wait = self._next_ready(time.monotonic())
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.consume()
+            self._bucket(item.chat_id).consume()
+            self._in_flight += 1
+            await self._slots.acquire()
+            asyncio.create_task(self._send(item))
+
+    async def _send(self, item: _Outgoing):
+        try:
+            result = await item.func(*item.args, **item.kwargs)
+            if not item.future.done():
+                item.future.set_result(result)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            # 429: останавливаем всю отправку на время, указанное Telegram
+            self._paused_until = max(self._paused_until, time.monotonic() + float(retry_after))
+            logger.warning(f"Flood control: pausing sends for {retry_after}s")
+            self._requeue(item, e)
+        except (BadRequest, Forbidden) as e:
+            # Ошибка запроса - повтор не поможет
+            logger.error(f"Send to {item.chat_id} rejected: {e}")
+            if not item.future.done():
+                item.future.set_exception(e)
+        except NetworkError as e:
+            # Таймауты и сетевые сбои (включая TimedOut)
+            self._requeue(item, e)
+        except Exception as e:
+            logger.error(f"Send to {item.chat_id} failed: {e}")
+            if not item.future.done():
+                item.future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+            self._wakeup.set()
+
+    def _requeue(self, item: _Outgoing, error: Exception):
+        item.attempt += 1
+        if item.attempt > self.max_retries:
+            logger.error(f"Send to {item.chat_id} dropped after {self.max_retries} retries: {error}")
+            if not item.future.done():
+                item.future.set_exception(error)
+            return
+        # Повтор - в начало своей полосы, чтобы сохранить порядок сообщений
+        self._lanes[item.priority].appendleft(item)
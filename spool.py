@@ -0,0 +1,179 @@
+"""
+Activat VC Bot - журнал записи на диск
+Пока Supabase недоступен, записи копятся в локальном append-only файле (JSONL)
+и досылаются пачками после восстановления связи
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Spool:
+    """Append-only журнал операций записи; fsync пачками, а не на каждую строку"""
+
+    def __init__(self, path: str, fsync_interval: float = 1.0, batch_size: int = 500):
+        self.path = path
+        # Файл, который сейчас досылается; переживает падение процесса
+        self.replay_path = path + '.replay'
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+
+        self._file = None
+        self._dirty = False
+        self._pending = self._count_lines(path) + self._count_lines(self.replay_path)
+        self._replay_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Количество операций в журнале"""
+        return self._pending
+
+    @staticmethod
+    def _count_lines(path: str) -> int:
+        try:
+            with open(path, 'rb') as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def append(self, op: str, table: str, rows: Any, **options):
+        """Запись операции в журнал: insert/upsert строк или вызов SQL-функции"""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(
+            {'op': op, 'table': table, 'rows': rows, 'options': options},
+            ensure_ascii=False,
+            default=str
+        ) + '\n')
+        self._dirty = True
+        self._pending += 1
+
+    async def start(self):
+        """Запуск фоновой синхронизации журнала на диск"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка синхронизации и закрытие файла"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._pending:
+            logger.warning(f"Spool closed with {self._pending} pending operations in {self.path}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Spool sync error: {e}")
+
+    async def sync(self):
+        """Сброс буфера и fsync всех накопленных записей одним вызовом"""
+        if not self._dirty or self._file is None:
+            return
+        self._dirty = False
+        self._file.flush()
+        await asyncio.to_thread(os.fsync, self._file.fileno())
+
+    async def replay(self, db) -> int:
+        """Досылка журнала по порядку: подряд идущие операции с одной таблицей уходят пачками"""
+        async with self._replay_lock:
+            if not os.path.exists(self.replay_path):
+                if not self._pending:
+                    return 0
+                # Новые записи во время досылки пойдут в свежий файл
+                await self.sync()
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                os.replace(self.path, self.replay_path)
+
+            with open(self.replay_path, encoding='utf-8') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+
+            sent = 0
+            remaining: List[dict] = []
+            index = 0
+            while index < len(entries):
+                op, table = entries[index]['op'], entries[index]['table']
+                key = self._key(entries[index])
+                # Пачка - только подряд идущие однотипные операции: порядок журнала сохраняется
+                # (регистрация пользователя уходит раньше обновления его активности).
+                # Инкременты досылаются по одному, чтобы при сбое не применить их дважды
+                step = 1 if op == 'rpc' else self.batch_size
+                end = index + 1
+                while end < len(entries) and end - index < step and self._key(entries[end]) == key:
+                    end += 1
+                chunk = entries[index:end]
+                try:
+                    await self._send(db, op, table, chunk)
+                    sent += len(chunk)
+                except Exception as e:
+                    if not db.is_outage(e):
+                        # Отвергнутые базой строки не блокируют остальной журнал
+                        logger.error(f"Spool dropped {len(chunk)} operations for {table}: {e}")
+                    else:
+                        logger.warning(f"Spool replay stopped at {table}: {e}")
+                        remaining = entries[index:]
+                        break
+                index = end
+
+            if remaining:
+                # Неотправленный хвост остается в файле досылки и в следующий раз уйдет первым,
+                # раньше записей, попавших в основной журнал позже
+                await asyncio.to_thread(self._rewrite, self.replay_path, remaining)
+            else:
+                os.remove(self.replay_path)
+            self._pending -= len(entries) - len(remaining)
+            if sent:
+                logger.info(f"✅ Spool replayed {sent} operations")
+            return sent
+
+    @staticmethod
+    def _key(entry: dict) -> Tuple:
+        return entry['op'], entry['table'], json.dumps(entry['options'], sort_keys=True)
+
+    @staticmethod
+    def _rewrite(path: str, entries: List[dict]):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    async def _send(db, op: str, table: str, chunk: List[dict]):
+        options = chunk[0]['options']
+        if op == 'rpc':
+            await db.call(table, chunk[0]['rows'])
+            return
+        rows = []
+        for entry in chunk:
+            rows.extend(entry['rows'] if isinstance(entry['rows'], list) else [entry['rows']])
+        if op == 'upsert':
+            on_conflict = options.get('on_conflict')
+            if on_conflict:
+                # Один ключ не может обновиться дважды в одном upsert: оставляем последнюю версию
+                columns = on_conflict.split(',')
+                rows = list({tuple(row.get(c) for c in columns): row for row in rows}.values())
+            await db.upsert(table, rows, **options)
+        else:
+            await db.insert(table, rows)
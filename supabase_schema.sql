@@ -17,20 +17,32 @@ CREATE TABLE IF NOT EXISTS users (
 
 CREATE INDEX idx_users_user_id ON users(user_id);
 CREATE INDEX idx_users_last_active ON users(last_active);
+CREATE INDEX idx_users_join_date ON users(join_date);
 
--- Таблица логов сообщений
+-- Таблица логов сообщений: помесячные партиции group_logs_ГГГГ_ММ
+-- (создаются ensure_group_logs_partitions, старые уходят в архив и удаляются ботом)
 CREATE TABLE IF NOT EXISTS group_logs (
-    id BIGSERIAL PRIMARY KEY,
+    id BIGSERIAL,
     user_id BIGINT NOT NULL,
     username TEXT,
     text TEXT,
     thread_id INTEGER,
-    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('russian', COALESCE(text, ''))) STORED,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Строки вне созданных партиций (не архивируется автоматически)
+CREATE TABLE IF NOT EXISTS group_logs_default PARTITION OF group_logs DEFAULT;
+
+-- Для баз, созданных до появления полнотекстового поиска
+ALTER TABLE group_logs ADD COLUMN IF NOT EXISTS
+    search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('russian', COALESCE(text, ''))) STORED;
 
 CREATE INDEX idx_group_logs_timestamp ON group_logs(timestamp DESC);
 CREATE INDEX idx_group_logs_user_id ON group_logs(user_id);
 CREATE INDEX idx_group_logs_thread_id ON group_logs(thread_id);
+CREATE INDEX idx_group_logs_search ON group_logs USING GIN(search_vector);
 
 -- Таблица shoutouts
 CREATE TABLE IF NOT EXISTS shoutouts (
@@ -52,6 +64,10 @@ CREATE TABLE IF NOT EXISTS challenges (
     is_active BOOLEAN DEFAULT TRUE
 );
 
+-- Пост челленджа в группе: ответы на него засчитываются в challenge_responses
+ALTER TABLE challenges ADD COLUMN IF NOT EXISTS chat_id BIGINT;
+ALTER TABLE challenges ADD COLUMN IF NOT EXISTS message_id BIGINT;
+
 CREATE INDEX idx_challenges_active ON challenges(is_active);
 CREATE INDEX idx_challenges_created_at ON challenges(created_at DESC);
 
@@ -84,11 +100,55 @@ CREATE TABLE IF NOT EXISTS pitches (
     username TEXT,
     text TEXT NOT NULL,
     likes INTEGER DEFAULT 0,
-    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    chat_id BIGINT,
+    message_id BIGINT
 );
 
+-- Для баз, созданных до подсчета лайков: сообщение питча, к которому привязаны реакции
+ALTER TABLE pitches ADD COLUMN IF NOT EXISTS chat_id BIGINT;
+ALTER TABLE pitches ADD COLUMN IF NOT EXISTS message_id BIGINT;
+
 CREATE INDEX idx_pitches_timestamp ON pitches(timestamp DESC);
 CREATE INDEX idx_pitches_likes ON pitches(likes DESC);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_pitches_message ON pitches(chat_id, message_id);
+
+-- Кто ответил на питч: ответ засчитывается лайком один раз на пользователя
+CREATE TABLE IF NOT EXISTS pitch_reply_likes (
+    chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (chat_id, message_id, user_id)
+);
+
+-- Реакции на сообщения, которых (пока) нет в pitches: строка питча могла задержаться в буфере
+-- записи или прийти на другую реплику. Забираются триггером при вставке питча, старые удаляются
+CREATE TABLE IF NOT EXISTS pitch_like_deltas (
+    chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    likes INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (chat_id, message_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_pitch_like_deltas_updated ON pitch_like_deltas(updated_at);
+
+-- Посты с хэштегами (#hiring, #event, #ask и др., см. TAGGED_POST_TAGS)
+CREATE TABLE IF NOT EXISTS tagged_posts (
+    id BIGSERIAL PRIMARY KEY,
+    tag TEXT NOT NULL,
+    user_id BIGINT NOT NULL,
+    username TEXT,
+    text TEXT NOT NULL,
+    thread_id INTEGER,
+    chat_id BIGINT,
+    message_id BIGINT,
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX idx_tagged_posts_tag ON tagged_posts(tag, timestamp DESC);
 
 -- Таблица оценок питчей
 CREATE TABLE IF NOT EXISTS pitch_ratings (
@@ -102,6 +162,20 @@ CREATE TABLE IF NOT EXISTS pitch_ratings (
 CREATE INDEX idx_pitch_ratings_author ON pitch_ratings(author_id);
 CREATE INDEX idx_pitch_ratings_timestamp ON pitch_ratings(timestamp DESC);
 
+-- Таблица активных опросов /ratepitch (переживают рестарт бота)
+CREATE TABLE IF NOT EXISTS pitch_polls (
+    poll_id TEXT PRIMARY KEY,
+    message_id BIGINT NOT NULL,
+    author_id BIGINT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    thread_id INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    close_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    closed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX idx_pitch_polls_open ON pitch_polls(close_at) WHERE closed_at IS NULL;
+
 -- Таблица бейджей
 CREATE TABLE IF NOT EXISTS badges (
     id BIGSERIAL PRIMARY KEY,
@@ -133,6 +207,72 @@ CREATE TABLE IF NOT EXISTS events (
 
 CREATE INDEX idx_events_date ON events(event_date);
 
+-- Менторы: темы в массиве; удаление - is_active = FALSE, чтобы бот увидел его по updated_at
+CREATE TABLE IF NOT EXISTS mentors (
+    id BIGSERIAL PRIMARY KEY,
+    handle TEXT NOT NULL UNIQUE,
+    name TEXT,
+    topics TEXT[] NOT NULL DEFAULT '{}',
+    is_active BOOLEAN DEFAULT TRUE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_mentors_updated ON mentors(updated_at);
+
+-- Синонимы тем: слово из запроса -> тема из mentors.topics
+CREATE TABLE IF NOT EXISTS mentor_topic_synonyms (
+    synonym TEXT PRIMARY KEY,
+    topic TEXT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_mentor_synonyms_updated ON mentor_topic_synonyms(updated_at);
+
+-- updated_at при любом изменении: по нему бот дочитывает каталог инкрементально
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_mentors_touch ON mentors;
+CREATE TRIGGER trg_mentors_touch BEFORE UPDATE ON mentors
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+DROP TRIGGER IF EXISTS trg_mentor_synonyms_touch ON mentor_topic_synonyms;
+CREATE TRIGGER trg_mentor_synonyms_touch BEFORE UPDATE ON mentor_topic_synonyms
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+-- Начальный каталог (раньше был зашит в /mentor)
+INSERT INTO mentors (handle, topics) VALUES
+    ('@mentor_product1', ARRAY['продукт']),
+    ('@mentor_product2', ARRAY['продукт']),
+    ('@mentor_marketing1', ARRAY['маркетинг']),
+    ('@mentor_tech1', ARRAY['технологии']),
+    ('@mentor_tech2', ARRAY['технологии']),
+    ('@mentor_finance1', ARRAY['финансы']),
+    ('@mentor_sales1', ARRAY['продажи'])
+ON CONFLICT (handle) DO NOTHING;
+
+INSERT INTO mentor_topic_synonyms (synonym, topic) VALUES
+    ('product', 'продукт'),
+    ('продакт', 'продукт'),
+    ('pm', 'продукт'),
+    ('marketing', 'маркетинг'),
+    ('маркетолог', 'маркетинг'),
+    ('growth', 'маркетинг'),
+    ('tech', 'технологии'),
+    ('it', 'технологии'),
+    ('разработка', 'технологии'),
+    ('cto', 'технологии'),
+    ('finance', 'финансы'),
+    ('инвестиции', 'финансы'),
+    ('фандрайзинг', 'финансы'),
+    ('sales', 'продажи'),
+    ('b2b', 'продажи')
+ON CONFLICT (synonym) DO NOTHING;
+
 -- Таблица анализа настроений
 CREATE TABLE IF NOT EXISTS sentiment_logs (
     id BIGSERIAL PRIMARY KEY,
@@ -146,14 +286,49 @@ CREATE TABLE IF NOT EXISTS sentiment_logs (
 
 CREATE INDEX idx_sentiment_logs_week ON sentiment_logs(week_start DESC);
 
+-- Дневные корзины эмодзи (пополняются при приеме сообщений, thread_id = 0 - без топика)
+CREATE TABLE IF NOT EXISTS sentiment_buckets (
+    day DATE NOT NULL,
+    thread_id INTEGER NOT NULL DEFAULT 0,
+    positive_count INTEGER DEFAULT 0,
+    negative_count INTEGER DEFAULT 0,
+    neutral_count INTEGER DEFAULT 0,
+    PRIMARY KEY (day, thread_id)
+);
+
+-- Дневная активность (пополняется ботом пачками инкрементов, отчеты читают ее вместо group_logs)
+CREATE TABLE IF NOT EXISTS activity_daily (
+    day DATE NOT NULL,
+    thread_id INTEGER NOT NULL DEFAULT 0,
+    user_id BIGINT NOT NULL,
+    messages INTEGER DEFAULT 0,
+    PRIMARY KEY (day, thread_id, user_id)
+);
+
+-- Разовое заполнение по уже накопленной истории (выполнить один раз при обновлении):
+-- INSERT INTO activity_daily (day, thread_id, user_id, messages)
+--     SELECT timestamp::DATE, COALESCE(thread_id, 0), user_id, COUNT(*)
+--     FROM group_logs GROUP BY 1, 2, 3
+--     ON CONFLICT (day, thread_id, user_id) DO NOTHING;
+
 -- Таблица логов бота
 CREATE TABLE IF NOT EXISTS bot_logs (
     id BIGSERIAL PRIMARY KEY,
     level TEXT NOT NULL,
     message TEXT NOT NULL,
-    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    fingerprint TEXT,
+    count INTEGER DEFAULT 1,
+    first_seen TIMESTAMP WITH TIME ZONE,
+    last_seen TIMESTAMP WITH TIME ZONE
 );
 
+-- Для баз, созданных до агрегации ошибок (одна строка на отпечаток за интервал)
+ALTER TABLE bot_logs ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+ALTER TABLE bot_logs ADD COLUMN IF NOT EXISTS count INTEGER DEFAULT 1;
+ALTER TABLE bot_logs ADD COLUMN IF NOT EXISTS first_seen TIMESTAMP WITH TIME ZONE;
+ALTER TABLE bot_logs ADD COLUMN IF NOT EXISTS last_seen TIMESTAMP WITH TIME ZONE;
+
 CREATE INDEX idx_bot_logs_level ON bot_logs(level);
 CREATE INDEX idx_bot_logs_timestamp ON bot_logs(timestamp DESC);
 
@@ -171,6 +346,286 @@ CREATE TABLE IF NOT EXISTS reports (
 CREATE INDEX idx_reports_status ON reports(status);
 CREATE INDEX idx_reports_created ON reports(created_at DESC);
 
+-- ========================================
+-- Функции аналитики (считаются на стороне БД)
+-- ========================================
+
+-- Агрегаты для /growth: одна строка вместо выгрузки users и group_logs
+CREATE OR REPLACE FUNCTION growth_stats()
+RETURNS TABLE (
+    total_users BIGINT,
+    new_week BIGINT,
+    new_month BIGINT,
+    active_week BIGINT,
+    messages_week BIGINT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        (SELECT COUNT(*) FROM users),
+        (SELECT COUNT(*) FROM users WHERE join_date > NOW() - INTERVAL '7 days'),
+        (SELECT COUNT(*) FROM users WHERE join_date > NOW() - INTERVAL '30 days'),
+        (SELECT COUNT(*) FROM users WHERE last_active > NOW() - INTERVAL '7 days'),
+        (SELECT COALESCE(SUM(messages), 0) FROM activity_daily WHERE day > CURRENT_DATE - 7)::BIGINT;
+$$;
+
+-- Полнотекстовый поиск для /search: ранжирование, фильтр по топику, курсор (rank, id)
+CREATE OR REPLACE FUNCTION search_group_logs(
+    search_query TEXT,
+    filter_thread_id INTEGER DEFAULT NULL,
+    cursor_rank REAL DEFAULT NULL,
+    cursor_id BIGINT DEFAULT NULL,
+    page_size INTEGER DEFAULT 5
+)
+RETURNS TABLE (
+    id BIGINT,
+    user_id BIGINT,
+    username TEXT,
+    text TEXT,
+    thread_id INTEGER,
+    "timestamp" TIMESTAMP WITH TIME ZONE,
+    rank REAL
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH hits AS (
+        SELECT g.id, g.user_id, g.username, g.text, g.thread_id, g.timestamp,
+               ts_rank_cd(g.search_vector, q.query) AS rank
+        FROM group_logs g,
+             websearch_to_tsquery('russian', search_query) AS q(query)
+        WHERE g.search_vector @@ q.query
+          AND (filter_thread_id IS NULL OR g.thread_id = filter_thread_id)
+    )
+    SELECT * FROM hits
+    WHERE cursor_id IS NULL OR (hits.rank, hits.id) < (cursor_rank, cursor_id)
+    ORDER BY hits.rank DESC, hits.id DESC
+    LIMIT page_size;
+$$;
+
+-- Атомарное пополнение корзин настроений пачкой дельт
+CREATE OR REPLACE FUNCTION increment_sentiment_buckets(deltas JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO sentiment_buckets AS b (day, thread_id, positive_count, negative_count, neutral_count)
+    SELECT d.day, d.thread_id, d.positive_count, d.negative_count, d.neutral_count
+    FROM jsonb_to_recordset(deltas) AS d(
+        day DATE, thread_id INTEGER, positive_count INTEGER, negative_count INTEGER, neutral_count INTEGER
+    )
+    ON CONFLICT (day, thread_id) DO UPDATE SET
+        positive_count = b.positive_count + EXCLUDED.positive_count,
+        negative_count = b.negative_count + EXCLUDED.negative_count,
+        neutral_count = b.neutral_count + EXCLUDED.neutral_count;
+$$;
+
+-- Атомарное пополнение дневной активности пачкой дельт
+CREATE OR REPLACE FUNCTION increment_activity_daily(deltas JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO activity_daily AS a (day, thread_id, user_id, messages)
+    SELECT d.day, d.thread_id, d.user_id, d.messages
+    FROM jsonb_to_recordset(deltas) AS d(day DATE, thread_id INTEGER, user_id BIGINT, messages INTEGER)
+    ON CONFLICT (day, thread_id, user_id) DO UPDATE SET
+        messages = a.messages + EXCLUDED.messages;
+$$;
+
+-- Итоги челленджа одним запросом: ответы и уникальные участники
+CREATE OR REPLACE FUNCTION challenge_stats(target_challenge_id BIGINT)
+RETURNS TABLE (responses BIGINT, participants BIGINT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT COUNT(*), COUNT(DISTINCT r.user_id)
+    FROM challenge_responses r
+    WHERE r.challenge_id = target_challenge_id;
+$$;
+
+-- Компактные данные для /cohorts: неделя вступления и маска активных недель каждого пользователя,
+-- вступившего за последние num_weeks недель (массивы в одной строке - без лимита строк PostgREST)
+CREATE OR REPLACE FUNCTION cohort_activity(num_weeks INTEGER DEFAULT 12)
+RETURNS TABLE (base_week DATE, join_weeks INTEGER[], active_masks BIGINT[])
+LANGUAGE sql STABLE
+AS $$
+    WITH base AS (
+        SELECT (date_trunc('week', NOW()) - make_interval(weeks => num_weeks - 1))::DATE AS week
+    ),
+    members AS (
+        SELECT u.user_id, (u.join_date::DATE - b.week) / 7 AS join_week
+        FROM users u, base b
+        WHERE u.join_date >= b.week
+    ),
+    activity AS (
+        SELECT a.user_id, bit_or(1::BIGINT << ((a.day - b.week) / 7)) AS mask
+        FROM activity_daily a, base b
+        WHERE a.day >= b.week
+        GROUP BY a.user_id
+    )
+    SELECT
+        b.week,
+        array_agg(m.join_week ORDER BY m.user_id),
+        array_agg(COALESCE(ac.mask, 0) ORDER BY m.user_id)
+    FROM base b
+    CROSS JOIN members m
+    LEFT JOIN activity ac ON ac.user_id = m.user_id
+    GROUP BY b.week;
+$$;
+
+-- Атомарное пополнение лайков питчей пачкой дельт реакций (от любой реплики, ключ - сообщение питча).
+-- Реакции автора не считаются; дельты для сообщений, которых еще нет в pitches, ждут в pitch_like_deltas
+CREATE OR REPLACE FUNCTION increment_pitch_likes(deltas JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    -- Реакции на обычные сообщения (не питчи) так и не дождутся строки
+    DELETE FROM pitch_like_deltas WHERE updated_at < NOW() - INTERVAL '7 days';
+
+    WITH d AS (
+        SELECT *
+        FROM jsonb_to_recordset(deltas) AS d(chat_id BIGINT, message_id BIGINT, user_id BIGINT, likes INTEGER)
+    ),
+    known AS (
+        SELECT d.chat_id, d.message_id, SUM(d.likes) FILTER (WHERE d.user_id <> p.user_id) AS likes
+        FROM d
+        JOIN pitches AS p ON p.chat_id = d.chat_id AND p.message_id = d.message_id
+        GROUP BY d.chat_id, d.message_id
+    ),
+    applied AS (
+        UPDATE pitches AS p
+        SET likes = GREATEST(0, p.likes + k.likes)
+        FROM known AS k
+        WHERE p.chat_id = k.chat_id AND p.message_id = k.message_id AND k.likes <> 0
+    )
+    INSERT INTO pitch_like_deltas AS x (chat_id, message_id, user_id, likes)
+    SELECT d.chat_id, d.message_id, d.user_id, d.likes
+    FROM d
+    WHERE NOT EXISTS (SELECT 1 FROM pitches AS p WHERE p.chat_id = d.chat_id AND p.message_id = d.message_id)
+    ON CONFLICT (chat_id, message_id, user_id)
+    DO UPDATE SET likes = x.likes + EXCLUDED.likes, updated_at = NOW();
+$$;
+
+-- Лайки-ответы пачкой: лайк добавляется только за первый ответ пользователя на питч
+CREATE OR REPLACE FUNCTION add_pitch_reply_likes(deltas JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    WITH fresh AS (
+        INSERT INTO pitch_reply_likes (chat_id, message_id, user_id)
+        SELECT d.chat_id, d.message_id, d.user_id
+        FROM jsonb_to_recordset(deltas) AS d(chat_id BIGINT, message_id BIGINT, user_id BIGINT)
+        ON CONFLICT DO NOTHING
+        RETURNING chat_id, message_id, user_id
+    )
+    UPDATE pitches AS p
+    SET likes = p.likes + (
+        SELECT COUNT(*)
+        FROM fresh AS f
+        WHERE f.chat_id = p.chat_id AND f.message_id = p.message_id AND f.user_id <> p.user_id
+    )
+    WHERE (p.chat_id, p.message_id) IN (SELECT chat_id, message_id FROM fresh);
+$$;
+
+-- Строка питча пришла позже лайков (ждала в буфере записи или в журнале): забираем накопленное
+CREATE OR REPLACE FUNCTION apply_pending_pitch_likes()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    pending INTEGER;
+    replies INTEGER;
+BEGIN
+    IF NEW.message_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+
+    WITH moved AS (
+        DELETE FROM pitch_like_deltas
+        WHERE chat_id = NEW.chat_id AND message_id = NEW.message_id
+        RETURNING user_id, likes
+    )
+    SELECT COALESCE(SUM(likes) FILTER (WHERE user_id <> NEW.user_id), 0) INTO pending FROM moved;
+
+    SELECT COUNT(*) INTO replies
+    FROM pitch_reply_likes AS r
+    WHERE r.chat_id = NEW.chat_id AND r.message_id = NEW.message_id AND r.user_id <> NEW.user_id;
+
+    NEW.likes := GREATEST(0, COALESCE(NEW.likes, 0) + pending) + replies;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pitches_pending_likes ON pitches;
+CREATE TRIGGER trg_pitches_pending_likes BEFORE INSERT ON pitches
+    FOR EACH ROW EXECUTE FUNCTION apply_pending_pitch_likes();
+
+-- ========================================
+-- Партиции group_logs
+-- ========================================
+
+-- Создание партиций на текущий и months_ahead следующих месяцев; возвращает созданные
+CREATE OR REPLACE FUNCTION ensure_group_logs_partitions(months_ahead INTEGER DEFAULT 2)
+RETURNS TABLE (partition_name TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE;
+    part TEXT;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        month_start := (date_trunc('month', NOW()) + make_interval(months => i))::DATE;
+        part := format('group_logs_%s', to_char(month_start, 'YYYY_MM'));
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF group_logs FOR VALUES FROM (%L) TO (%L)',
+                part, month_start, (month_start + INTERVAL '1 month')::DATE
+            );
+            partition_name := part;
+            RETURN NEXT;
+        END IF;
+    END LOOP;
+END;
+$$;
+
+-- Помесячные партиции и их границы (без default)
+CREATE OR REPLACE FUNCTION list_group_logs_partitions()
+RETURNS TABLE (partition_name TEXT, range_start TIMESTAMPTZ, range_end TIMESTAMPTZ)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        c.relname::TEXT,
+        to_timestamp(substring(c.relname FROM '\d{4}_\d{2}$'), 'YYYY_MM'),
+        to_timestamp(substring(c.relname FROM '\d{4}_\d{2}$'), 'YYYY_MM') + INTERVAL '1 month'
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'group_logs'::regclass
+      AND c.relname ~ '^group_logs_\d{4}_\d{2}$'
+    ORDER BY c.relname;
+$$;
+
+-- Удаление партиции после выгрузки в архив (только помесячные)
+CREATE OR REPLACE FUNCTION drop_group_logs_partition(partition_name TEXT)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF partition_name !~ '^group_logs_\d{4}_\d{2}$' THEN
+        RAISE EXCEPTION 'Not a group_logs partition: %', partition_name;
+    END IF;
+    EXECUTE format('DROP TABLE IF EXISTS %I', partition_name);
+END;
+$$;
+
+SELECT ensure_group_logs_partitions(2);
+
+-- Перенос существующей непартиционированной group_logs (выполнить один раз вместо CREATE TABLE выше):
+-- ALTER TABLE group_logs RENAME TO group_logs_legacy;
+-- -- создать group_logs и индексы из этого файла, затем партиции за всю историю, например:
+-- -- CREATE TABLE group_logs_2024_01 PARTITION OF group_logs FOR VALUES FROM ('2024-01-01') TO ('2024-02-01');
+-- INSERT INTO group_logs (id, user_id, username, text, thread_id, timestamp)
+--     SELECT id, user_id, username, text, thread_id, COALESCE(timestamp, NOW()) FROM group_logs_legacy;
+-- SELECT setval(pg_get_serial_sequence('group_logs', 'id'), (SELECT MAX(id) FROM group_logs));
+-- DROP TABLE group_logs_legacy;
+
 -- ========================================
 -- ВАЖНО: Row Level Security (RLS)
 -- ========================================
@@ -0,0 +1,50 @@
+"""
+Activat VC Bot - маршрутизация хэштегов
+Все зарегистрированные теги собраны в одно регулярное выражение: один проход по тексту
+без копии в нижнем регистре, на каждый найденный тег - свой обработчик
+"""
+
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Pattern
+
+TagHandler = Callable[..., Awaitable]
+
+
+class TagRouter:
+    """Тег -> обработчик; match() находит все зарегистрированные теги за один проход"""
+
+    def __init__(self):
+        self._handlers: Dict[str, TagHandler] = {}
+        self._pattern: Optional[Pattern] = None
+
+    @property
+    def tags(self) -> List[str]:
+        return list(self._handlers)
+
+    def route(self, tag: str, handler: TagHandler):
+        """Регистрация обработчика для #tag (регистр не важен)"""
+        self._handlers[tag.lstrip('#').lower()] = handler
+        self._pattern = None
+
+    def match(self, text: str) -> List[str]:
+        """Уникальные теги сообщения в порядке появления"""
+        if self._pattern is None:
+            if not self._handlers:
+                return []
+            # Длинные теги раньше коротких: #asking не должен совпасть как #ask
+            alternatives = '|'.join(re.escape(tag) for tag in sorted(self._handlers, key=len, reverse=True))
+            self._pattern = re.compile(rf'(?<![\w#])#({alternatives})(?!\w)', re.IGNORECASE)
+
+        found: List[str] = []
+        for m in self._pattern.finditer(text):
+            tag = m.group(1).lower()
+            if tag not in found:
+                found.append(tag)
+        return found
+
+    async def dispatch(self, text: str, *args, **kwargs) -> List[str]:
+        """Вызов обработчиков всех тегов сообщения: handler(tag, *args, **kwargs)"""
+        tags = self.match(text)
+        for tag in tags:
+            await self._handlers[tag](tag, *args, **kwargs)
+        return tags
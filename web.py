@@ -0,0 +1,87 @@
+"""
+Activat VC Bot - HTTP-сервер
+Прием вебхуков Telegram на PORT: быстрый ответ, обработка в пуле воркеров Application
+Также отдает /metrics (Prometheus) и /health
+"""
+
+import hmac
+import logging
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """aiohttp-сервер: проверяет секрет, кладет апдейт в очередь и сразу отвечает 200"""
+
+    def __init__(
+        self,
+        application: Application,
+        port: int,
+        path: Optional[str] = '/telegram',
+        secret_token: Optional[str] = None,
+        max_queue: int = 1000
+    ):
+        self.application = application
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.max_queue = max_queue
+        self.app = web.Application()
+        # path=None - только метрики и health (polling режим)
+        if path:
+            self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get('/health', self.handle_health)
+        self.app.router.add_get('/metrics', self.handle_metrics)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Прием апдейта от Telegram"""
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ''), self.secret_token
+        ):
+            return web.Response(status=403)
+
+        # Очередь переполнена: 503 заставит Telegram повторить доставку позже
+        if self.application.update_queue.qsize() >= self.max_queue:
+            return web.Response(status=503)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """Проверка живости для Render"""
+        return web.Response(text='ok')
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Метрики в формате Prometheus"""
+        body, content_type = metrics.render()
+        return web.Response(body=body, headers={'Content-Type': content_type})
+
+    async def start(self):
+        """Запуск сервера на 0.0.0.0:PORT"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '0.0.0.0', self.port).start()
+        logger.info(f"✅ HTTP server listening on port {self.port}")
+
+    async def stop(self):
+        """Остановка сервера"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None